@@ -0,0 +1,273 @@
+"""
+In-memory stand-ins for the MongoDB side of the service and round-trip
+counters for both MongoDB and Redis.
+
+FakePrisma implements the subset of the generated Prisma client the service
+uses and is installed onto the real `helpers.db.prisma_client` instance, so
+every module that imported it sees the fake. Each awaited call counts as one
+database round trip and sleeps for the configured latency.
+"""
+import asyncio
+import bisect
+import itertools
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from prisma.errors import UniqueViolationError
+from redis.asyncio.client import Pipeline
+
+
+class RoundTrips:
+    def __init__(self):
+        self.db = 0
+        self.redis = 0
+
+    def snapshot(self):
+        return self.db, self.redis
+
+
+round_trips = RoundTrips()
+
+
+# optional fields Prisma leaves unset on MongoDB; the models read them as None
+UNSET_FIELDS = {"archivedAt"}
+
+
+class Row:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def __getattr__(self, name):
+        if name in UNSET_FIELDS:
+            return None
+        raise AttributeError(name)
+
+    def model_dump(self, **kwargs) -> Dict[str, Any]:
+        return {
+            key: [item.model_dump() for item in value] if isinstance(value, list) else value
+            for key, value in self.__dict__.items()
+        }
+
+
+def _matches(row: Row, where: Optional[Dict[str, Any]]) -> bool:
+    for field, condition in (where or {}).items():
+        if field == "OR":
+            if not any(_matches(row, branch) for branch in condition):
+                return False
+            continue
+        value = getattr(row, field, None)
+        if isinstance(condition, dict):
+            if "isSet" in condition and (field in row.__dict__) != condition["isSet"]:
+                return False
+            if "in" in condition and value not in condition["in"]:
+                return False
+            if "lt" in condition and not value < condition["lt"]:
+                return False
+            if "gt" in condition and not value > condition["gt"]:
+                return False
+            if "not" in condition and value == condition["not"]:
+                return False
+            if "is" in condition and value != condition["is"]:
+                return False
+        elif condition is None and field not in row.__dict__:
+            # like Prisma on MongoDB: equality with None doesn't match unset fields
+            return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeModel:
+    def __init__(self, db: "FakePrisma", name: str, unique: Optional[tuple] = None):
+        self._db = db
+        self._name = name
+        self._unique = unique
+        self.ids: List[str] = []
+        self.rows: Dict[str, Row] = {}
+        self._unique_index: Dict[tuple, str] = {}
+        # secondary indexes: field -> value -> set of ids
+        self._indexes: Dict[str, Dict[str, set]] = {"pollId": {}, "userId": {}}
+
+    async def _round_trip(self):
+        round_trips.db += 1
+        await asyncio.sleep(self._db.latency)
+
+    def insert(self, data: Dict[str, Any]) -> Row:
+        if self._name == "Poll":
+            data = {"createdAt": datetime.now(timezone.utc), **data}
+        row = Row(**data)
+        if self._unique:
+            key = tuple(data.get(field) for field in self._unique)
+            if key in self._unique_index or row.id in self.rows:
+                raise UniqueViolationError(f"Unique constraint failed on {self._name}")
+            self._unique_index[key] = row.id
+        self.rows[row.id] = row
+        bisect.insort(self.ids, row.id)
+        for field, index in self._indexes.items():
+            if field in data:
+                index.setdefault(data[field], set()).add(row.id)
+        return row
+
+    def _candidates(self, where: Optional[Dict[str, Any]]) -> List[str]:
+        for field, index in self._indexes.items():
+            condition = (where or {}).get(field)
+            if isinstance(condition, str):
+                return sorted(index.get(condition, ()))
+            if isinstance(condition, dict) and "in" in condition:
+                return sorted(set().union(*(index.get(value, set()) for value in condition["in"])))
+        if where and isinstance(where.get("id"), dict) and "in" in where["id"]:
+            return sorted(i for i in where["id"]["in"] if i in self.rows)
+        return self.ids
+
+    def _with_relations(self, row: Row, include: Optional[Dict[str, Any]]) -> Row:
+        relations = {}
+        if include and include.get("options"):
+            relations["options"] = [self._db.option.rows[i] for i in sorted(self._db.option._indexes["pollId"].get(row.id, ()))]
+        if include and include.get("snapshot"):
+            snapshot_ids = self._db.pollsnapshot._indexes["pollId"].get(row.id, ())
+            relations["snapshot"] = self._db.pollsnapshot.rows[min(snapshot_ids)] if snapshot_ids else None
+        return Row(**row.__dict__, **relations) if relations else row
+
+    async def find_many(self, where=None, take=None, skip=None, cursor=None, order=None, include=None, **kwargs):
+        await self._round_trip()
+        ids = self._candidates(where)
+        start = 0
+        if cursor:
+            start = bisect.bisect_left(ids, cursor["id"])
+            if start == len(ids) or ids[start] != cursor["id"]:
+                return []
+        start += skip or 0
+        if order and list(order.values())[0] == "desc":
+            ids = list(reversed(ids[:start + 1] if cursor else ids))
+            start = skip or 0
+        result = []
+        for row_id in itertools.islice(ids, start, None):
+            row = self.rows[row_id]
+            # relation filters match on the loaded relation
+            candidate = self._with_relations(row, {"snapshot": True}) if where and "snapshot" in where else row
+            if _matches(candidate, where):
+                result.append(self._with_relations(row, include))
+                if take and len(result) >= take:
+                    break
+        return result
+
+    async def find_unique(self, where, include=None):
+        await self._round_trip()
+        row = self.rows.get(where["id"])
+        return self._with_relations(row, include) if row else None
+
+    async def find_first(self, where=None, include=None, **kwargs):
+        rows = await self.find_many(where=where, take=1, include=include)
+        return rows[0] if rows else None
+
+    async def update_many(self, where, data):
+        await self._round_trip()
+        updated = 0
+        for row_id in self._candidates(where):
+            row = self.rows[row_id]
+            if _matches(row, where):
+                row.__dict__.update(data)
+                updated += 1
+        return updated
+
+    async def create(self, data, include=None):
+        await self._round_trip()
+        return self.insert(data)
+
+    async def create_many(self, data, **kwargs):
+        await self._round_trip()
+        for item in data:
+            self.insert(item)
+        return len(data)
+
+    async def group_by(self, by, where=None, count=None, **kwargs):
+        await self._round_trip()
+        groups: Dict[tuple, int] = {}
+        for row_id in self._candidates(where):
+            row = self.rows[row_id]
+            if _matches(row, where):
+                key = tuple(getattr(row, field) for field in by)
+                groups[key] = groups.get(key, 0) + 1
+        return [{**dict(zip(by, key)), "_count": {"_all": n}} for key, n in groups.items()]
+
+
+class FakeBatch:
+    def __init__(self, db: "FakePrisma"):
+        self._db = db
+        self._queries = []
+        for name in ("poll", "option", "vote", "like"):
+            setattr(self, name, _BatchActions(self, getattr(db, name)))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc is None:
+            await self.commit()
+
+    async def commit(self):
+        round_trips.db += 1
+        await asyncio.sleep(self._db.latency)
+        for model, data in self._queries:
+            for item in data:
+                model.insert(item)
+
+
+class _BatchActions:
+    def __init__(self, batch: FakeBatch, model: FakeModel):
+        self._batch = batch
+        self._model = model
+
+    def create_many(self, data, **kwargs):
+        self._batch._queries.append((self._model, data))
+
+
+class FakePrisma:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.poll = FakeModel(self, "Poll")
+        self.option = FakeModel(self, "Option")
+        self.vote = FakeModel(self, "Vote", unique=("userId", "pollId"))
+        self.like = FakeModel(self, "Like", unique=("userId", "pollId"))
+        self.pollsnapshot = FakeModel(self, "PollSnapshot", unique=("pollId",))
+        self.pollcountsample = FakeModel(self, "PollCountSample")
+
+    def batch_(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    def is_connected(self) -> bool:
+        return True
+
+    def install(self, prisma_client):
+        # the service modules hold a reference to this instance, patch it in place
+        for name in ("poll", "option", "vote", "like", "pollsnapshot", "pollcountsample", "batch_", "connect", "disconnect", "is_connected"):
+            setattr(prisma_client, name, getattr(self, name))
+
+
+def count_redis_round_trips(redis_client):
+    """
+    Counts every command sent by `redis_client` and every pipeline as one
+    round trip each. Pub/sub connections are not counted.
+    """
+    execute_command = redis_client.execute_command
+
+    async def counted(*args, **kwargs):
+        round_trips.redis += 1
+        return await execute_command(*args, **kwargs)
+
+    redis_client.execute_command = counted
+
+    pipeline_execute = Pipeline.execute
+
+    async def counted_pipeline(self, *args, **kwargs):
+        if self.command_stack:
+            round_trips.redis += 1
+        return await pipeline_execute(self, *args, **kwargs)
+
+    Pipeline.execute = counted_pipeline
@@ -0,0 +1,326 @@
+"""
+Load test and benchmark for the poll API.
+
+Runs the app in-process under uvicorn with MongoDB replaced by an in-memory
+fake (optionally with simulated per-call latency) and Redis by fakeredis, or
+a real Redis with --redis-url, then drives the HTTP endpoints and the
+/ws/updates socket and writes the results as JSON.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.run --polls 1000 --output results.json
+    python -m benchmarks.run --polls 100000 --hot-polls 10 --hot-fraction 0.9
+    python -m benchmarks.run --compare results.json
+
+Per scenario it reports throughput, p50/p95/p99 latency and the average
+number of MongoDB and Redis round trips per request. The fan-out scenario
+reports the time from sending a vote to each subscribed client receiving the
+update.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# the service refuses to start without these; the values only matter locally
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-not-for-production")
+os.environ.setdefault("API_DATABASE_URL", "mongodb://benchmark/fake")
+
+import fakeredis
+import httpx
+import jwt
+import redis.asyncio as redis
+import socketio
+import uvicorn
+
+from benchmarks.fakes import FakePrisma, count_redis_round_trips, round_trips
+from helpers import counters
+from helpers.db import prisma_client, redis_client
+from helpers.object_id import new_object_id
+
+SCENARIOS = ["create-poll", "get-all-polls", "get-poll-by-id", "vote-on-poll", "fanout"]
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies: List[float], seconds: float, db: int, redis: int, errors: int) -> Dict[str, Any]:
+    requests = len(latencies) + errors
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "db_round_trips_per_request": round(db / requests, 2) if requests else 0.0,
+        "redis_round_trips_per_request": round(redis / requests, 2) if requests else 0.0,
+    }
+
+
+def make_token(user_id: str) -> str:
+    payload = {"sub": user_id, "email": f"{user_id}@bench.test", "name": "bench", "exp": int(time.time()) + 3600}
+    return jwt.encode(payload, os.environ["JWT_SECRET_KEY"], algorithm="HS256")
+
+
+class Dataset:
+    """
+    Seeded polls: the first `hot_polls` ids receive `hot_fraction` of the
+    reads and votes, the rest is spread uniformly.
+    """
+
+    def __init__(self, poll_ids: List[str], options: Dict[str, List[str]], hot_polls: int, hot_fraction: float, rng: random.Random):
+        self.poll_ids = poll_ids
+        self.options = options
+        self.hot = poll_ids[:hot_polls]
+        self.hot_fraction = hot_fraction
+        self.rng = rng
+
+    def pick(self) -> str:
+        if self.hot and self.rng.random() < self.hot_fraction:
+            return self.rng.choice(self.hot)
+        return self.rng.choice(self.poll_ids)
+
+
+async def seed(fake: FakePrisma, args, rng: random.Random) -> Dataset:
+    # inserted straight into the fake so seeding does not count as traffic
+    owner = new_object_id()
+    poll_ids, option_ids = [], {}
+    for i in range(args.polls):
+        poll_id = new_object_id()
+        poll_ids.append(poll_id)
+        fake.poll.insert({"id": poll_id, "question": f"Seeded poll {i}", "userId": owner, "email": "seed@bench.test"})
+        option_ids[poll_id] = []
+        for j in range(args.options):
+            option_id = new_object_id()
+            fake.option.insert({"id": option_id, "text": f"Option {j}", "pollId": poll_id})
+            option_ids[poll_id].append(option_id)
+    # counters are initialised the way create-poll does it, in pipelines of 1000
+    for start in range(0, args.polls, 1000):
+        batch = poll_ids[start:start + 1000]
+        await counters.init_counts([(poll_id, option_ids[poll_id]) for poll_id in batch])
+    return Dataset(poll_ids, option_ids, args.hot_polls, args.hot_fraction, rng)
+
+
+async def drive(requests: int, concurrency: int, send: Callable[[int], Awaitable[httpx.Response]]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await send(i)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    db_before, redis_before = round_trips.snapshot()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    db_after, redis_after = round_trips.snapshot()
+    return summarize(latencies, seconds, db_after - db_before, redis_after - redis_before, errors)
+
+
+async def fanout(base_url: str, client: httpx.AsyncClient, poll_id: str, option_id: str, clients: int, votes: int) -> Dict[str, Any]:
+    """
+    Sends `votes` votes for one option one after the other; the n-th vote is
+    the one that takes the count to n. A client has received vote n once it
+    sees a count of at least n (updates may be coalesced).
+    """
+    received: List[List[tuple]] = [[] for _ in range(clients)]
+    sockets = []
+    for i in range(clients):
+        sock = socketio.AsyncClient()
+
+        def on_vote(data, log=received[i]):
+            if data["poll_id"] == poll_id and data["option_id"] == option_id:
+                log.append((time.perf_counter(), data["vote_count"]))
+
+        sock.on("vote-update", on_vote)
+        await sock.connect(base_url, socketio_path="/ws/updates", transports=["websocket"])
+        await sock.call("subscribe", {"poll_id": poll_id})
+        sockets.append(sock)
+
+    base = (await counters.get_counts(poll_id, [option_id]))[option_id]
+    sent: List[float] = []
+    tokens = [make_token(new_object_id()) for _ in range(votes)]
+    for token in tokens:
+        sent.append(time.perf_counter())
+        await client.post(f"/api/poll/vote-on-poll/{poll_id}/{option_id}", headers={"Authorization": f"Bearer {token}"})
+    await asyncio.sleep(1.0)
+    for sock in sockets:
+        await sock.disconnect()
+
+    latencies: List[float] = []
+    missed = 0
+    for log in received:
+        for n, sent_at in enumerate(sent, start=base + 1):
+            receipt = next((at for at, count in log if count >= n), None)
+            if receipt is None:
+                missed += 1
+            else:
+                latencies.append(max(receipt - sent_at, 0.0))
+    return {
+        "clients": clients,
+        "votes": votes,
+        "missed": missed,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    if args.redis_url:
+        redis_client.connection_pool = redis.Redis.from_url(args.redis_url).connection_pool
+        await redis_client.flushdb()
+    else:
+        redis_client.connection_pool = fakeredis.FakeAsyncRedis().connection_pool
+    count_redis_round_trips(redis_client)
+
+    fake = FakePrisma(latency=args.db_latency_ms / 1000)
+    fake.install(prisma_client)
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    dataset = await seed(fake, args, rng)
+    seed_seconds = time.perf_counter() - started
+
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    tokens = [make_token(new_object_id()) for _ in range(args.users)]
+    results: Dict[str, Any] = {}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            def auth(i: int) -> Dict[str, str]:
+                return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+            scenarios: Dict[str, Callable[[int], Awaitable[httpx.Response]]] = {
+                "create-poll": lambda i: client.post(
+                    "/api/poll/create-poll",
+                    json={"question": f"Bench poll {i}", "email": "", "options": [{"text": f"Option {j}"} for j in range(args.options)]},
+                    headers=auth(i),
+                ),
+                "get-all-polls": lambda i: client.get(
+                    "/api/poll/get-all-polls",
+                    params={"limit": args.page_size, **({"cursor": dataset.pick()} if i % 2 else {})},
+                    headers=auth(i),
+                ),
+                "get-poll-by-id": lambda i: client.get(f"/api/poll/get-poll-by-id/{dataset.pick()}", headers=auth(i)),
+            }
+
+            # one vote per generated user; a fresh token per request avoids duplicates
+            vote_tokens = [make_token(new_object_id()) for _ in range(args.requests if "vote-on-poll" in args.scenarios else 0)]
+
+            def vote(i: int):
+                poll_id = dataset.pick()
+                option_id = rng.choice(dataset.options[poll_id])
+                return client.post(
+                    f"/api/poll/vote-on-poll/{poll_id}/{option_id}",
+                    headers={"Authorization": f"Bearer {vote_tokens[i]}"},
+                )
+
+            scenarios["vote-on-poll"] = vote
+
+            for name in args.scenarios:
+                if name == "fanout":
+                    continue
+                if name.startswith("get-"):
+                    # warm-up reads fill the poll cache and are not measured
+                    await drive(min(args.concurrency * 2, args.requests), args.concurrency, scenarios[name])
+                results[name] = await drive(args.requests, args.concurrency, scenarios[name])
+                print(f"{name:>16}: {results[name]}")
+
+            if "fanout" in args.scenarios:
+                hot = dataset.hot[0] if dataset.hot else dataset.poll_ids[0]
+                results["fanout"] = await fanout(base_url, client, hot, dataset.options[hot][0], args.clients, args.fanout_votes)
+                print(f"{'fanout':>16}: {results['fanout']}")
+    finally:
+        server.should_exit = True
+        await serve
+
+    return {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "seed_seconds": round(seed_seconds, 3),
+        "results": results,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    print(f"\nCompared with {baseline.get('commit')}:")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for metric, value in result.items():
+            if isinstance(value, (int, float)) and before.get(metric):
+                deltas.append(f"{metric} {(value - before[metric]) / before[metric]:+.1%}")
+        print(f"{name:>16}: {', '.join(deltas)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the poll API against in-memory stand-ins")
+    parser.add_argument("--polls", type=int, default=1000, help="polls seeded before the run")
+    parser.add_argument("--options", type=int, default=4, help="options per poll")
+    parser.add_argument("--hot-polls", type=int, default=10, help="number of hot polls")
+    parser.add_argument("--hot-fraction", type=float, default=0.8, help="share of reads and votes going to the hot polls")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=1000, help="distinct users making reads")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=50, help="socket clients in the fan-out scenario")
+    parser.add_argument("--fanout-votes", type=int, default=100)
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="simulated latency of each MongoDB round trip")
+    parser.add_argument("--redis-url", help="use this Redis (flushed first) instead of fakeredis")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="print the change against a previous results file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Serialization benchmark for a page of poll responses.
+
+Compares the previous path (model_dump, PollResponse validation, FastAPI's
+jsonable_encoder and json rendering) with the current one (plain dicts built
+by the controllers, rendered by orjson), and with the compact format.
+
+    python -m benchmarks.serialization --polls 10000 --output serialization.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from unittest.mock import patch
+
+# needed to import the controllers, no token is verified here
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret-key-not-for-production")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import controllers.poll as controllers
+from helpers.object_id import new_object_id
+from helpers.responses import FastJSONResponse, compact_polls
+from models.poll import PollPage, PollResponse
+
+
+# same shape as the models generated by Prisma Client Python (pydantic models)
+class PrismaOption(BaseModel):
+    id: str
+    text: str
+    pollId: str
+
+
+class PrismaPoll(BaseModel):
+    id: str
+    question: str
+    userId: str
+    email: str
+    createdAt: datetime
+    archivedAt: Optional[datetime] = None
+    options: Optional[List[PrismaOption]] = None
+    snapshot: Optional[Any] = None
+
+
+def make_polls(count: int, options: int):
+    polls, all_counts, voted = [], {}, {}
+    for i in range(count):
+        poll_id = new_object_id()
+        poll_options = [PrismaOption(id=new_object_id(), text=f"Option {j}", pollId=poll_id) for j in range(options)]
+        polls.append(PrismaPoll(
+            id=poll_id,
+            question=f"Question {i}",
+            userId=new_object_id(),
+            email="user@example.com",
+            createdAt=datetime.now(timezone.utc),
+            options=poll_options,
+        ))
+        all_counts[poll_id] = {"likes": i % 97, **{option.id: (i * j) % 1000 for j, option in enumerate(poll_options)}}
+        if i % 3 == 0:
+            voted[poll_id] = poll_options[0].id
+    return polls, all_counts, voted
+
+
+def previous_path(polls, all_counts, voted) -> bytes:
+    response_list = []
+    for poll in polls:
+        poll_dict = poll.model_dump()
+        poll_dict["counts"] = all_counts[poll.id]
+        poll_dict["userHasVoted"] = voted.get(poll.id, None)
+        poll_dict["userHasLiked"] = False
+        poll_dict["email"] = poll.email
+        response_list.append(PollResponse(**poll_dict))
+    page = PollPage(polls=response_list, nextCursor=None)
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+_loop = asyncio.new_event_loop()
+
+
+async def _build(polls, all_counts, voted) -> List[Dict[str, Any]]:
+    # the controllers' builder with the Redis/MongoDB reads stubbed out
+    async def get_counts_many(_):
+        return all_counts
+
+    async def load_user_state(user_id, poll_ids):
+        return voted, set()
+
+    with patch.object(controllers.counters, "get_counts_many", get_counts_many), \
+            patch.object(controllers, "load_user_state", load_user_state):
+        return await controllers._build_poll_responses(polls, "")
+
+
+def fast_path(polls, all_counts, voted) -> bytes:
+    page = {"polls": _loop.run_until_complete(_build(polls, all_counts, voted)), "nextCursor": None}
+    return FastJSONResponse(page).body
+
+
+def compact_path(polls, all_counts, voted) -> bytes:
+    page = {"polls": compact_polls(_loop.run_until_complete(_build(polls, all_counts, voted))), "nextCursor": None}
+    return FastJSONResponse(page).body
+
+
+PATHS: Dict[str, Callable[..., bytes]] = {
+    "previous": previous_path,
+    "fast": fast_path,
+    "compact": compact_path,
+}
+
+
+def measure(path: Callable[..., bytes], data, repeat: int) -> Dict[str, Any]:
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = path(*data)
+        timings.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+        "bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark poll response serialization")
+    parser.add_argument("--polls", type=int, default=10000)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    data = make_polls(args.polls, args.options)
+    # both full paths must produce the same document
+    assert json.loads(previous_path(*data)) == json.loads(fast_path(*data))
+
+    results = {name: measure(path, data, args.repeat) for name, path in PATHS.items()}
+    for name, result in results.items():
+        speedup = results["previous"]["median_ms"] / result["median_ms"] if result["median_ms"] else 0
+        print(f"{name:>9}: {result} ({speedup:.1f}x)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
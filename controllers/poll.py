@@ -1,35 +1,77 @@
 from prisma import Prisma
 from fastapi import HTTPException, status
 from dotenv import load_dotenv
-from models.poll import PollCreate, PollResponse
+from models.poll import PollCreate, Vote, Like, BulkVote
 import json
-from typing import Dict, Any, List
+import os
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple, Set
 from helpers.db import prisma_client, redis_client
+from helpers import archive, counters, etags, metrics, poll_cache, responses, single_flight, trending, write_behind
+from helpers.object_id import new_object_id, is_object_id
+from helpers.auth_middleware import CurrentUser
 import asyncio
+from datetime import datetime, timezone
 load_dotenv()
 
-# create poll
-async def create_poll(poll: PollCreate, current_user: Dict[str, Any]):
+# create polls
+MAX_BULK_POLLS = 500
+
+async def _create_polls(polls: List[PollCreate], current_user: CurrentUser) -> List[Dict[str, Any]]:
+    """
+    Creates polls and their options in one batched transaction. Ids are
+    generated up front, so no matter how many polls or options there are it
+    is a single database round trip plus one Redis pipeline for the counters.
+    """
+    created_at = datetime.now(timezone.utc)
+    poll_rows, option_rows, created = [], [], []
+
+    for poll in polls:
+        poll_id = new_object_id()
+        options = [
+            {"id": new_object_id(), "text": option.text, "pollId": poll_id}
+            for option in poll.options or []
+        ]
+        poll_row = {
+            "id": poll_id,
+            "question": poll.question,
+            "userId": current_user.id,
+            "email": current_user.email,
+            "createdAt": created_at,
+        }
+        poll_rows.append(poll_row)
+        option_rows.extend(options)
+        created.append({**poll_row, "options": options})
+
+    async with prisma_client.batch_() as batcher:
+        batcher.poll.create_many(data=poll_rows)
+        if option_rows:
+            batcher.option.create_many(data=option_rows)
+
+    # first reads find every field instead of missing keys
+    await counters.init_counts([
+        (poll["id"], [option["id"] for option in poll["options"]]) for poll in created
+    ])
+    return created
+
+
+async def create_poll(poll: PollCreate, current_user: CurrentUser):
     try:
-        created_poll = await prisma_client.poll.create(
-            data= {
-                "question": poll.question,
-                "userId": current_user["id"],
-                "email": current_user["email"],
-            }
+        created = await _create_polls([poll], current_user)
+        return created[0]
+    except Exception as e:
+        error_message = str(e)
+        print(f"Database error: {error_message}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {error_message}"
         )
 
-        # Create options if they exist
-        if hasattr(poll, 'options') and poll.options:
-            for option in poll.options:
-                await prisma_client.option.create(
-                    data={
-                        "text": option.text,
-                        "pollId": created_poll.id,
-                    }
-                )
-
-        return created_poll.model_dump()
+
+async def create_polls(polls: List[PollCreate], current_user: CurrentUser):
+    if len(polls) > MAX_BULK_POLLS:
+        raise HTTPException(status_code=400, detail=f"Cannot create more than {MAX_BULK_POLLS} polls per request")
+    try:
+        return await _create_polls(polls, current_user) if polls else []
     except Exception as e:
         error_message = str(e)
         print(f"Database error: {error_message}")
@@ -39,49 +81,274 @@ async def create_poll(poll: PollCreate, current_user: Dict[str, Any]):
         )
 
 
-# get poll by id
-async def get_poll_by_id(poll_id: str, user_id: str) -> PollResponse:
+# user specific state (votes and likes) for a set of polls
+#
+# Requests made in the same event loop iteration are answered together, so
+# many users reading the same poll at once cost one query per model.
+_user_state_requests: List[Tuple[str, List[str], asyncio.Future]] = []
+_user_state_tasks: Set[asyncio.Task] = set()
+
+
+async def load_user_state(user_id: str, poll_ids: List[str]) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Loads the user's votes and likes for the given polls, returning
+    ({poll_id: option_id}, {liked poll_id}).
+    """
+    if not poll_ids:
+        return {}, set()
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _user_state_requests.append((user_id, poll_ids, future))
+    if len(_user_state_requests) == 1:
+        loop.call_soon(_start_user_state_load)
+    return await future
+
+
+def _start_user_state_load():
+    task = asyncio.create_task(_load_user_states())
+    _user_state_tasks.add(task)
+    task.add_done_callback(_user_state_tasks.discard)
+
+
+async def _load_user_states():
+    requests = _user_state_requests[:]
+    _user_state_requests.clear()
+    metrics.user_state_batch.observe(len(requests))
+
+    user_ids = list({user_id for user_id, _, _ in requests})
+    poll_ids = list({poll_id for _, ids, _ in requests for poll_id in ids})
+    where = {
+        "userId": user_ids[0] if len(user_ids) == 1 else {"in": user_ids},
+        "pollId": {"in": poll_ids},
+    }
     try:
-        # include options, votes, and likes
-        poll = await prisma_client.poll.find_unique(
-            where={"id": poll_id},
-            include={
-                "options": True,
-            }
+        user_votes, user_likes = await asyncio.gather(
+            prisma_client.vote.find_many(where=where),
+            prisma_client.like.find_many(where=where),
         )
-        if not poll:
-            raise HTTPException(status_code=404, detail="Poll not found")
-        
-        # get like count for the poll
-        redis_key = [f"poll:{poll_id}:likes"]
-        option_ids = [option.id for option in poll.options]
-        redis_key.extend([f"poll:{poll_id}:option:{option_id}" for option_id in option_ids])
-
-        # all count in one go
-        counts, user_vote, user_like = await asyncio.gather(
-            redis_client.mget(redis_key),
-            prisma_client.vote.find_first(
-                where={"userId": user_id, "pollId": poll_id}
-            ),
-            prisma_client.like.find_first(
-                where={"userId": user_id, "pollId": poll_id}
-            )
+    except Exception as e:
+        for _, _, future in requests:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    # the query covers every user x poll pair, each request keeps its own
+    voted: Dict[str, Dict[str, str]] = {}
+    liked: Dict[str, Set[str]] = {}
+    for v in user_votes:
+        voted.setdefault(v.userId, {})[v.pollId] = v.optionId
+    for l in user_likes:
+        liked.setdefault(l.userId, set()).add(l.pollId)
+    for user_id, ids, future in requests:
+        if future.done():
+            continue
+        user_voted, user_liked = voted.get(user_id, {}), liked.get(user_id, set())
+        future.set_result((
+            {poll_id: user_voted[poll_id] for poll_id in ids if poll_id in user_voted},
+            {poll_id for poll_id in ids if poll_id in user_liked},
+        ))
+
+
+def _poll_response(poll: Dict[str, Any], options: List[Dict[str, Any]], counts: Dict[str, int], user_voted_poll_ids: Dict[str, str], user_liked_poll_ids: Set[str]) -> Dict[str, Any]:
+    # a PollResponse as a plain dict: every field comes from our own rows and
+    # counters, so it is not validated again and orjson renders it directly
+    return {
+        "id": poll["id"],
+        "question": poll["question"],
+        "userId": poll["userId"],
+        "email": poll["email"],
+        "createdAt": poll["createdAt"],
+        "options": options,
+        "counts": counts,
+        "userHasVoted": user_voted_poll_ids.get(poll["id"], None),
+        "userHasLiked": poll["id"] in user_liked_poll_ids,
+        "archivedAt": poll.get("archivedAt"),
+    }
+
+
+# counts + user state for a page of polls, shared by every listing controller
+async def _build_poll_responses(polls, user_id: str) -> List[Dict[str, Any]]:
+    if not polls:
+        return []
+
+    # get likes and votes counts each option, one pipelined read per page,
+    # shared with identical reads in flight; the user state is per user.
+    # Archived polls have their final counts in their snapshot
+    poll_ids = tuple(poll.id for poll in polls)
+    live = [poll for poll in polls if not poll.snapshot]
+    all_counts, (user_voted_poll_ids, user_liked_poll_ids) = await asyncio.gather(
+        single_flight.do("counts", tuple(poll.id for poll in live), lambda: counters.get_counts_many([(poll.id, [option.id for option in poll.options]) for poll in live])),
+        load_user_state(user_id, list(poll_ids)),
+    )
+    final_counts = {
+        poll.id: counters.unpack_counts([option.id for option in poll.options], poll.snapshot.votes, poll.snapshot.likes)
+        for poll in polls if poll.snapshot
+    }
+
+    return [
+        _poll_response(
+            poll.__dict__,
+            [{"id": option.id, "text": option.text, "pollId": option.pollId} for option in poll.options],
+            final_counts[poll.id] if poll.id in final_counts else all_counts[poll.id],
+            user_voted_poll_ids,
+            user_liked_poll_ids,
+        )
+        for poll in polls
+    ]
+
+
+# counts + user state for cached poll documents, shared by the controllers
+# reading through helpers.poll_cache
+async def _build_doc_responses(docs: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+    if not docs:
+        return []
+
+    poll_ids = tuple(doc["id"] for doc in docs)
+    live = [doc for doc in docs if "finalCounts" not in doc]
+    all_counts, (user_voted_poll_ids, user_liked_poll_ids) = await asyncio.gather(
+        single_flight.do("counts", tuple(doc["id"] for doc in live), lambda: counters.get_counts_many([(doc["id"], [option["id"] for option in doc["options"]]) for doc in live])),
+        load_user_state(user_id, list(poll_ids)),
+    )
+
+    return [
+        _poll_response(
+            # parsed back so every endpoint renders dates the same way
+            {
+                **doc,
+                "createdAt": datetime.fromisoformat(doc["createdAt"]),
+                "archivedAt": datetime.fromisoformat(doc["archivedAt"]) if doc.get("archivedAt") else None,
+            },
+            doc["options"],
+            doc["finalCounts"] if "finalCounts" in doc else all_counts[doc["id"]],
+            user_voted_poll_ids,
+            user_liked_poll_ids,
         )
+        for doc in docs
+    ]
 
-        final_counts = {
-            "likes": int(counts[0] or 0),
+
+async def _get_poll_docs(poll_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    # poll documents with options, from the cache when possible
+    if len(poll_ids) == 1:
+        # a viral poll's concurrent readers share one load
+        poll_id = poll_ids[0]
+        doc = await single_flight.do("poll", poll_id, lambda: poll_cache.get_poll(poll_id))
+        return {poll_id: doc} if doc else {}
+    return await poll_cache.get_polls(poll_ids)
+
+
+async def _get_poll_responses(poll_ids: List[str], user_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # responses of the polls found, in the order of poll_ids, and the missing ids
+    docs = await _get_poll_docs(poll_ids)
+    found = [docs[poll_id] for poll_id in poll_ids if poll_id in docs]
+    missing = [poll_id for poll_id in poll_ids if poll_id not in docs]
+    # all count in one go
+    return await _build_doc_responses(found, user_id), missing
+
+
+# get poll by id
+async def get_poll_by_id(poll_id: str, user_id: str) -> Dict[str, Any]:
+    try:
+        polls, missing = await _get_poll_responses([poll_id], user_id)
+        if missing:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        return polls[0]
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        error_message = str(e)
+        print(f"Database error: {error_message}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
+
+
+# get polls by ids, for feeds and embeds
+MAX_POLLS_BY_IDS = 100
+
+
+async def get_polls_by_ids(poll_ids: List[str], user_id: str) -> Dict[str, Any]:
+    """
+    Many get_poll_by_id at once: one poll cache batch (a single find_many for
+    the polls not cached), one pipelined counts read and one vote and like
+    query for the user. Polls keep the request order, duplicates are dropped
+    and ids that don't exist are listed in `missing`.
+    """
+    if len(poll_ids) > MAX_POLLS_BY_IDS:
+        raise HTTPException(status_code=400, detail=f"Cannot get more than {MAX_POLLS_BY_IDS} polls per request")
+    try:
+        poll_ids = list(dict.fromkeys(poll_ids))
+        # ids that aren't ObjectIds can't exist, and would make prisma fail
+        valid = [poll_id for poll_id in poll_ids if is_object_id(poll_id)]
+        polls, missing = await _get_poll_responses(valid, user_id) if valid else ([], [])
+        missing = set(missing)
+        return {
+            "polls": polls,
+            "missing": [poll_id for poll_id in poll_ids if poll_id in missing or not is_object_id(poll_id)],
         }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        error_message = str(e)
+        print(f"Database error: {error_message}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
 
-        for i, option_id in enumerate(option_ids):
-            final_counts[option_id] = int(counts[i+1] or 0)
 
-        poll_dict = poll.model_dump()
-        poll_dict["counts"] = final_counts
+# count history of a poll, for result charts
+DEFAULT_HISTORY_SIZE = 100
+MAX_HISTORY_SIZE = 1000
 
-        poll_dict["userHasVoted"] = user_vote.optionId if user_vote else None
-        poll_dict["userHasLiked"] = user_like if user_like else None
 
-        return PollResponse(**poll_dict)
+async def get_poll_history(poll_id: str, limit: int = DEFAULT_HISTORY_SIZE) -> Dict[str, Any]:
+    """
+    The latest `limit` count samples of a poll, oldest first. Samples are
+    taken by helpers.archive while the poll is open, the last one when it is
+    archived.
+    """
+    try:
+        docs = await _get_poll_docs([poll_id]) if is_object_id(poll_id) else {}
+        if poll_id not in docs:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        doc = docs[poll_id]
+        samples = await archive.get_history(poll_id, [option["id"] for option in doc["options"]], limit)
+        return {
+            "pollId": poll_id,
+            "archivedAt": datetime.fromisoformat(doc["archivedAt"]) if doc.get("archivedAt") else None,
+            "samples": samples,
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        error_message = str(e)
+        print(f"Database error: {error_message}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
+
+
+DEFAULT_TRENDING_SIZE = 20
+MAX_TRENDING_SIZE = 100
+
+
+# get trending polls
+async def get_trending_polls(user_id: str, window: str = trending.DEFAULT_WINDOW, limit: int = DEFAULT_TRENDING_SIZE) -> Dict[str, Any]:
+    """
+    Top polls by decayed vote + like activity in the window. The ranking
+    comes from Redis, documents from the poll cache.
+    """
+    try:
+        if window not in trending.WINDOWS:
+            raise HTTPException(status_code=400, detail=f"Unknown window, expected one of: {', '.join(trending.WINDOWS)}")
+
+        ranked = await trending.top(window, limit)
+        docs = await poll_cache.get_polls([poll_id for poll_id, _ in ranked])
+        # polls deleted since they were voted on are skipped
+        found = [(docs[poll_id], score) for poll_id, score in ranked if poll_id in docs]
+        responses = await _build_doc_responses([doc for doc, _ in found], user_id)
+
+        return {
+            "window": window,
+            "polls": [{**response, "score": score} for response, (_, score) in zip(responses, found)],
+        }
+    except HTTPException as e:
+        raise e
     except Exception as e:
         error_message = str(e)
         print(f"Database error: {error_message}")
@@ -89,61 +356,14 @@ async def get_poll_by_id(poll_id: str, user_id: str) -> PollResponse:
 
 
 # get poll by user id
-async def get_poll_by_user_id(user_id: str) -> List[PollResponse]:
+async def get_poll_by_user_id(user_id: str) -> List[Dict[str, Any]]:
     try:
         polls = await prisma_client.poll.find_many(
             where={"userId": user_id},
-            include={
-                "options": True
-            }
+            include=poll_cache.POLL_INCLUDE,
         )
 
-        all_redis_keys = []
-        poll_key_map = {} 
-        
-        for poll in polls:
-            poll_keys = [f"poll:{poll.id}:likes"]
-            poll_key_map[poll.id] = {"like_key": poll_keys[0], "option_keys": []}
-            
-            for option in poll.options:
-                opt_key = f"poll:{poll.id}:option:{option.id}"
-                poll_keys.append(opt_key)
-                poll_key_map[poll.id]["option_keys"].append((option.id, opt_key))
-                
-            all_redis_keys.extend(poll_keys)
-
-        all_counts = await redis_client.mget(all_redis_keys)
-        counts_dict = dict(zip(all_redis_keys, all_counts))
-
-        response_list = []
-        for poll in polls:
-            final_counts = {}
-            key_map = poll_key_map[poll.id]
-            
-            # Get like count
-            final_counts["likes"] = int(counts_dict.get(key_map["like_key"]) or 0)
-            
-            # Get option counts
-            for option_id, opt_key in key_map["option_keys"]:
-                final_counts[option_id] = int(counts_dict.get(opt_key) or 0)
-
-            # user specific counts
-            user_votes = await prisma_client.vote.find_many(where={"userId": user_id})
-            user_likes = await prisma_client.like.find_many(where={"userId": user_id})
-
-            user_voted_poll_ids = {v.pollId: v.optionId for v in user_votes}
-            user_liked_poll_ids = {l.pollId for l in user_likes}
-
-            
-            poll_dict = poll.model_dump()
-            poll_dict["counts"] = final_counts
-
-            poll_dict["userHasVoted"] = user_voted_poll_ids.get(poll.id, None)
-            poll_dict["userHasLiked"] = poll.id in user_liked_poll_ids
-
-            response_list.append(PollResponse(**poll_dict))
-            
-        return response_list
+        return await _build_poll_responses(polls, user_id)
 
     except Exception as e:
         error_message = str(e)
@@ -152,143 +372,220 @@ async def get_poll_by_user_id(user_id: str) -> List[PollResponse]:
 
 
 # get all polls
-async def get_all_polls(user_id: str) -> List[PollResponse]:
-    try:
-        polls = await prisma_client.poll.find_many(
-            include={
-                "options": True,
-            }
-        )
+DEFAULT_PAGE_SIZE = int(os.getenv("API_POLL_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 200
+
+def _validate_cursor(cursor: Optional[str]):
+    # cursors are poll ObjectIds, anything else would make prisma fail with a 500
+    if cursor is not None and not is_object_id(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _fetch_poll_page(cursor: Optional[str], limit: int):
+    return await single_flight.do("page", (cursor, limit), lambda: _query_poll_page(cursor, limit))
+
+
+async def _query_poll_page(cursor: Optional[str], limit: int):
+    # keyset pagination on the ObjectId, which is ordered by creation time
+    query = {
+        "take": limit + 1,
+        "order": {"id": "asc"},
+        "include": poll_cache.POLL_INCLUDE,
+    }
+    if cursor:
+        query["cursor"] = {"id": cursor}
+        query["skip"] = 1
 
-        # get likes and votes counts each option
-        all_redis_keys = []
-        poll_key_map = {} 
-        
-        for poll in polls:
-            poll_keys = [f"poll:{poll.id}:likes"]
-            poll_key_map[poll.id] = {"like_key": poll_keys[0], "option_keys": []}
-            
-            for option in poll.options:
-                opt_key = f"poll:{poll.id}:option:{option.id}"
-                poll_keys.append(opt_key)
-                poll_key_map[poll.id]["option_keys"].append((option.id, opt_key))
-                
-            all_redis_keys.extend(poll_keys)
-
-        all_counts = await redis_client.mget(all_redis_keys)
-        counts_dict = dict(zip(all_redis_keys, all_counts))
-
-        response_list = []
-        for poll in polls:
-            final_counts = {}
-            key_map = poll_key_map[poll.id]
-            
-            # Get like count
-            final_counts["likes"] = int(counts_dict.get(key_map["like_key"]) or 0)
-            
-            # Get option counts
-            for option_id, opt_key in key_map["option_keys"]:
-                final_counts[option_id] = int(counts_dict.get(opt_key) or 0)
-
-            # user specific counts
-            user_votes = await prisma_client.vote.find_many(where={"userId": user_id})
-            user_likes = await prisma_client.like.find_many(where={"userId": user_id})
-
-            user_voted_poll_ids = {v.pollId: v.optionId for v in user_votes}
-            user_liked_poll_ids = {l.pollId for l in user_likes}
-
-            
-            poll_dict = poll.model_dump()
-            poll_dict["counts"] = final_counts
-
-            poll_dict["userHasVoted"] = user_voted_poll_ids.get(poll.id, None)
-            poll_dict["userHasLiked"] = poll.id in user_liked_poll_ids
-
-            poll_dict["email"] = poll.email
-            response_list.append(PollResponse(**poll_dict))
-            
-        return response_list
+    polls = await prisma_client.poll.find_many(**query)
 
+    next_cursor = None
+    if len(polls) > limit:
+        polls = polls[:limit]
+        next_cursor = polls[-1].id
+    return polls, next_cursor
+
+
+async def get_all_polls(user_id: str, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, list_version: Optional[int] = None) -> Dict[str, Any]:
+    try:
+        _validate_cursor(cursor)
+        polls, next_cursor = await _fetch_poll_page(cursor, limit)
+        if list_version is not None:
+            # the page's ids, so later conditional requests skip MongoDB
+            await etags.remember_page(cursor, limit, [poll.id for poll in polls], list_version)
+        response_list = await _build_poll_responses(polls, user_id)
+        return {"polls": response_list, "nextCursor": next_cursor}
+
+    except HTTPException as e:
+        raise e
     except Exception as e:
         error_message = str(e)
         print(f"Database error: {error_message}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
 
 
+# stream all polls as NDJSON, one page in memory at a time
+def stream_all_polls(user_id: str, cursor: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE, compact: bool = False) -> AsyncIterator[bytes]:
+    # validate before the response starts, errors can't change the status later
+    _validate_cursor(cursor)
+    return _stream_poll_pages(user_id, cursor, page_size, compact)
+
+
+async def _stream_poll_pages(user_id: str, cursor: Optional[str], page_size: int, compact: bool) -> AsyncIterator[bytes]:
+    while True:
+        try:
+            polls, cursor = await _fetch_poll_page(cursor, page_size)
+            response_list = await _build_poll_responses(polls, user_id)
+        except Exception as e:
+            # headers are already sent, so all we can do is stop the stream
+            print(f"Database error: {str(e)}")
+            return
+
+        for response in response_list:
+            yield responses.dumps(responses.compact_poll(response) if compact else response) + b"\n"
+
+        if cursor is None:
+            return
+
+
+
+async def _ensure_open(poll_id: str, option_id: Optional[str] = None):
+    # the poll must exist, take the option and not be archived before any
+    # counter is touched; usually a local cache hit
+    doc = await poll_cache.get_poll(poll_id) if is_object_id(poll_id) else None
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    if option_id is not None and all(option["id"] != option_id for option in doc["options"]):
+        raise HTTPException(status_code=400, detail="Option does not belong to this poll")
+    if doc.get("archivedAt"):
+        raise HTTPException(status_code=400, detail="Poll is archived")
+
 
 # vote on a poll
-async def vote_on_poll(poll_id: str, option_id: str, current_user: Dict[str, Any]):
+async def vote_on_poll(poll_id: str, option_id: str, current_user: CurrentUser):
     try:
-        # check if user has already voted on the poll
-        existing_vote = await prisma_client.vote.find_first(
-            where={"userId": current_user["id"], "optionId": option_id, "pollId": poll_id}
-        )
-        if existing_vote:
-            raise HTTPException(status_code=400, detail="User has already voted on this poll")
-        created_vote = await prisma_client.vote.create(
-            data={
-                "userId": current_user["id"],
-                "optionId": option_id,
-                "pollId": poll_id,
-            }
-        )
-
-        # Redis increment vote count
-        redis_key = f"poll:{poll_id}:option:{option_id}"
-        new_vote_count = await redis_client.incr(redis_key)
+        await _ensure_open(poll_id, option_id)
+        # dedupe, increment and publish in one round trip
+        record = write_behind.vote_record(poll_id, option_id, current_user.id)
+        new_vote_count = await counters.record_vote(poll_id, option_id, current_user.id, write_behind.stream_entry(record))
         if new_vote_count is None:
-            raise HTTPException(status_code=500, detail="Failed to increment vote count")
-
-        message = {
-            "poll_id": poll_id,
-            "option_id": option_id,
-            "vote_count": new_vote_count,
-            "user_id": current_user["id"],
-        }
+            raise HTTPException(status_code=400, detail="User has already voted on this poll")
 
-        # sending the message to the message queue
-        await redis_client.publish("poll-updates", json.dumps(message))
+        # the Vote row is written in batches after the response
+        await write_behind.enqueue_recorded(record)
 
-        return created_vote.model_dump()
+        return Vote(id=record["id"], userId=current_user.id, optionId=option_id, pollId=poll_id).model_dump()
+    except HTTPException as e:
+        raise e
     except Exception as e:
         error_message = str(e)
         print(f"Database error: {error_message}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
 
 # like a poll
-async def like_poll(poll_id: str, current_user: Dict[str, Any]):
+async def like_poll(poll_id: str, current_user: CurrentUser):
     try:
-        # check if user has already liked the poll
-        existing_like = await prisma_client.like.find_first(
-            where={"userId": current_user["id"], "pollId": poll_id}
-        )
-        if existing_like:
+        await _ensure_open(poll_id)
+        # dedupe, increment and publish in one round trip
+        record = write_behind.like_record(poll_id, current_user.id)
+        new_like_count = await counters.record_like(poll_id, current_user.id, write_behind.stream_entry(record))
+        if new_like_count is None:
             raise HTTPException(status_code=400, detail="User has already liked this poll")
-        created_like = await prisma_client.like.create(
-            data={
-                "userId": current_user["id"],
-                "pollId": poll_id,
-            }
-        )
 
-        # Redis increment like count
-        redis_key = f"poll:{poll_id}:likes"
-        new_like_count = await redis_client.incr(redis_key)
-        if new_like_count is None:
-            raise HTTPException(status_code=500, detail="Failed to increment like count")
+        # the Like row is written in batches after the response
+        await write_behind.enqueue_recorded(record)
 
-        message = {
-            "poll_id": poll_id,
-            "type": "like",
-            "like_count": new_like_count,
-            "user_id": current_user["id"],
-        }
+        return Like(id=record["id"], userId=current_user.id, pollId=poll_id).model_dump()
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        error_message = str(e)
+        print(f"Database error: {error_message}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
 
-        # sending the message to the message queue
-        await redis_client.publish("poll-updates", json.dumps(message))
 
-        return created_like.model_dump()
+# bulk vote ingestion, for integrations replaying votes collected offline
+MAX_BULK_VOTES = 5000
+BULK_VOTE_USERS = {user_id.strip() for user_id in os.getenv("API_BULK_VOTE_USERS", "").split(",") if user_id.strip()}
+
+
+def _bulk_vote_status(vote: BulkVote, polls: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    # status of a vote that can't be recorded, None when it is valid
+    if not (is_object_id(vote.userId) and is_object_id(vote.pollId) and is_object_id(vote.optionId)):
+        return "invalid_id"
+    poll = polls.get(vote.pollId)
+    if poll is None:
+        return "poll_not_found"
+    if poll.get("archivedAt"):
+        return "poll_archived"
+    if all(option["id"] != vote.optionId for option in poll["options"]):
+        return "invalid_option"
+    return None
+
+
+async def bulk_vote(votes: List[BulkVote], current_user: CurrentUser) -> Dict[str, Any]:
+    """
+    Records many votes at once. Polls are loaded in one batch, existing votes
+    are found with one query on the unique (userId, pollId) pairs, the
+    counters and updates go through counters.record_votes and the rows are
+    written with create_many. Returns a status per vote, in request order.
+    """
+    if current_user.id not in BULK_VOTE_USERS:
+        raise HTTPException(status_code=403, detail="Forbidden: Bulk voting is not allowed for this user")
+    if len(votes) > MAX_BULK_VOTES:
+        raise HTTPException(status_code=400, detail=f"Cannot record more than {MAX_BULK_VOTES} votes per request")
+    try:
+        results: List[Dict[str, Any]] = [{"status": None, "id": None} for _ in votes]
+
+        polls = await poll_cache.get_polls([vote.pollId for vote in votes if is_object_id(vote.pollId)])
+        seen = set()
+        valid = []
+        for index, vote in enumerate(votes):
+            outcome = _bulk_vote_status(vote, polls)
+            if outcome is None and (vote.userId, vote.pollId) in seen:
+                outcome = "duplicate"
+            if outcome is not None:
+                results[index]["status"] = outcome
+                continue
+            seen.add((vote.userId, vote.pollId))
+            valid.append(index)
+
+        if valid:
+            existing = await prisma_client.vote.find_many(where={
+                "userId": {"in": list({votes[index].userId for index in valid})},
+                "pollId": {"in": list({votes[index].pollId for index in valid})},
+            })
+            voted = {(vote.userId, vote.pollId) for vote in existing}
+            for index in valid:
+                if (votes[index].userId, votes[index].pollId) in voted:
+                    results[index]["status"] = "already_voted"
+            valid = [index for index in valid if results[index]["status"] is None]
+
+        if valid:
+            added = await counters.record_votes([(votes[index].pollId, votes[index].optionId, votes[index].userId) for index in valid])
+            records = []
+            for index, ok in zip(valid, added):
+                if not ok:
+                    # recorded in Redis, the row is still being written behind
+                    results[index]["status"] = "already_voted"
+                    continue
+                record = write_behind.vote_record(votes[index].pollId, votes[index].optionId, votes[index].userId)
+                records.append(record)
+                results[index].update(status="recorded", id=record["id"])
+            if records:
+                # rows that didn't land had their count rolled back
+                rejected = await write_behind.write(records)
+                for index in valid:
+                    reason = rejected.get(results[index]["id"])
+                    if reason is not None:
+                        results[index].update(status="already_voted" if reason == write_behind.DUPLICATE else "failed", id=None)
+
+        return {
+            "recorded": sum(1 for result in results if result["status"] == "recorded"),
+            "results": results,
+        }
+    except HTTPException as e:
+        raise e
     except Exception as e:
         error_message = str(e)
         print(f"Database error: {error_message}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal server error: {error_message}")
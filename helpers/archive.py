@@ -0,0 +1,218 @@
+# Archiving of old polls and count history
+#
+# Polls older than ARCHIVE_AFTER_DAYS are closed: archivedAt is set, votes and
+# likes are refused, and once their rows are settled (see reconcile.SETTLE)
+# the final counts are frozen into a PollSnapshot document and every Redis key
+# of the poll is evicted. Reads serve archived polls from the snapshot, which
+# the poll cache keeps with the document.
+#
+# Independently, the counts of polls whose version changed are sampled every
+# SAMPLE_INTERVAL seconds into PollCountSample rows, the series behind result
+# charts; archiving writes the last sample.
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+from helpers.db import prisma_client, redis_client
+from helpers import counters, locks, metrics, poll_cache, reconcile
+from helpers.object_id import new_object_id
+
+load_dotenv()
+
+# 0 disables archiving
+ARCHIVE_AFTER_DAYS = float(os.getenv("API_ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_INTERVAL = float(os.getenv("API_ARCHIVE_INTERVAL", "3600"))
+# 0 disables sampling
+SAMPLE_INTERVAL = float(os.getenv("API_POLL_SAMPLE_INTERVAL", "0"))
+# time for every worker to drop the cached document of a closed poll and for
+# votes already past the check to land
+GRACE = float(os.getenv("API_ARCHIVE_GRACE", "2"))
+BATCH_SIZE = int(os.getenv("API_ARCHIVE_BATCH_SIZE", "200"))
+
+# poll id -> version of its last sample
+SAMPLED_KEY = "polls:sampled"
+ARCHIVE_LOCK_KEY = "archive:lock"
+SAMPLE_LOCK_KEY = "sample:lock"
+
+
+def _sample_row(poll_id: str, option_ids: List[str], counts: Dict[str, int], taken_at: datetime) -> Dict[str, Any]:
+    votes, likes = counters.pack_counts(option_ids, counts)
+    return {"id": new_object_id(), "pollId": poll_id, "votes": votes, "likes": likes, "takenAt": taken_at}
+
+
+async def _pages(where: Dict[str, Any], batch_size: int):
+    # polls matching `where` by id; archiving changes what matches, so the
+    # next page starts after the last id instead of at a prisma cursor
+    last_id = None
+    while True:
+        page_where = {**where, "id": {"gt": last_id}} if last_id else where
+        polls = await prisma_client.poll.find_many(
+            where=page_where,
+            take=batch_size,
+            order={"id": "asc"},
+            include={"options": True},
+        )
+        if not polls:
+            return
+        yield polls
+        if len(polls) < batch_size:
+            return
+        last_id = polls[-1].id
+
+
+async def close_old_polls(cutoff: datetime, batch_size: int = BATCH_SIZE) -> int:
+    # sets archivedAt on open polls created before the cutoff
+    closed: List[str] = []
+    now = datetime.now(timezone.utc)
+    async for polls in _pages({**poll_cache.OPEN_POLLS, "createdAt": {"lt": cutoff}}, batch_size):
+        poll_ids = [poll.id for poll in polls]
+        await prisma_client.poll.update_many(where={"id": {"in": poll_ids}}, data={"archivedAt": now})
+        await poll_cache.invalidate_many(poll_ids)
+        # responses now carry archivedAt, ETags must change
+        await counters.bump_versions(poll_ids)
+        closed.extend(poll_ids)
+
+    if closed:
+        # a read that loaded a poll from MongoDB before update_many may have
+        # cached the open document again after the invalidation; left there,
+        # it would keep accepting votes for up to the cache TTL
+        await asyncio.sleep(GRACE)
+        for start in range(0, len(closed), batch_size):
+            await poll_cache.invalidate_many(closed[start:start + batch_size])
+    return len(closed)
+
+
+async def _snapshot_batch(polls, stats: Dict[str, int]):
+    poll_ids = [poll.id for poll in polls]
+    # rows of recently touched polls may still be queued for write-behind
+    settled = time.time() - reconcile.SETTLE
+    scores = await redis_client.zmscore(counters.TOUCHED_KEY, poll_ids)
+    polls = [poll for poll, score in zip(polls, scores) if score is None or score <= settled]
+    stats["skipped"] += len(poll_ids) - len(polls)
+    if not polls:
+        return
+
+    poll_ids = [poll.id for poll in polls]
+    grouped = await reconcile.grouped_counts(poll_ids)
+    now = datetime.now(timezone.utc)
+    samples = [_sample_row(poll.id, [option.id for option in poll.options or []], grouped.get(poll.id, {}), now) for poll in polls]
+    # the final sample goes first: the snapshot marks the poll as done
+    await prisma_client.pollcountsample.create_many(data=samples)
+    await prisma_client.pollsnapshot.create_many(data=[
+        {"id": new_object_id(), "pollId": sample["pollId"], "votes": sample["votes"], "likes": sample["likes"], "createdAt": now}
+        for sample in samples
+    ])
+
+    # readers switch to the snapshot before the counters disappear
+    await poll_cache.invalidate_many(poll_ids)
+    await asyncio.sleep(GRACE)
+    await counters.evict(poll_ids)
+    stats["archived"] += len(poll_ids)
+    metrics.polls_archived.inc(len(poll_ids))
+    metrics.count_samples.inc(len(samples))
+
+
+async def archive_old_polls(after_days: float = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Closes the polls older than `after_days`, then snapshots every closed
+    poll without a snapshot whose rows are settled. Polls skipped because
+    they were touched recently are picked up by the next run.
+    """
+    started = time.time()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=after_days)
+    stats = {"closed": await close_old_polls(cutoff, batch_size), "archived": 0, "skipped": 0}
+
+    async for polls in _pages({**poll_cache.ARCHIVED_POLLS, "snapshot": {"is": None}}, batch_size):
+        await _snapshot_batch(polls, stats)
+
+    return {**stats, "seconds": round(time.time() - started, 3)}
+
+
+async def _changed_polls(batch_size: int):
+    # pages of (poll id, version) whose version moved since their last sample
+    cursor = 0
+    while True:
+        cursor, versions = await redis_client.hscan(counters.VERSIONS_KEY, cursor, count=batch_size)
+        if versions:
+            versions = {
+                (poll_id.decode() if isinstance(poll_id, bytes) else poll_id): int(version)
+                for poll_id, version in versions.items()
+            }
+            sampled = await redis_client.hmget(SAMPLED_KEY, list(versions))
+            changed = [
+                (poll_id, version)
+                for (poll_id, version), last in zip(versions.items(), sampled)
+                if last is None or int(last) != version
+            ]
+            if changed:
+                yield changed
+        if cursor == 0:
+            return
+
+
+async def sample_counts(batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Writes a PollCountSample for every open poll whose counts or rows changed
+    since its last sample.
+    """
+    started = time.time()
+    stats = {"sampled": 0}
+    async for changed in _changed_polls(batch_size):
+        # versions are read before the counts, so a sample is never older
+        # than the version it is recorded under
+        docs = await poll_cache.get_polls([poll_id for poll_id, _ in changed])
+        open_ids = [poll_id for poll_id, _ in changed if poll_id in docs and not docs[poll_id].get("archivedAt")]
+        if open_ids:
+            option_ids = {poll_id: [option["id"] for option in docs[poll_id]["options"]] for poll_id in open_ids}
+            all_counts = await counters.get_counts_many([(poll_id, option_ids[poll_id]) for poll_id in open_ids])
+            now = datetime.now(timezone.utc)
+            await prisma_client.pollcountsample.create_many(data=[
+                _sample_row(poll_id, option_ids[poll_id], all_counts[poll_id], now) for poll_id in open_ids
+            ])
+        # archived and deleted polls are recorded too, so they aren't looked up again
+        await redis_client.hset(SAMPLED_KEY, mapping=dict(changed))
+        stats["sampled"] += len(open_ids)
+        metrics.count_samples.inc(len(open_ids))
+    return {**stats, "seconds": round(time.time() - started, 3)}
+
+
+async def get_history(poll_id: str, option_ids: List[str], limit: int) -> List[Dict[str, Any]]:
+    # the poll's latest samples, oldest first, with counts keyed like PollResponse.counts
+    samples = await prisma_client.pollcountsample.find_many(
+        where={"pollId": poll_id},
+        take=limit,
+        order={"takenAt": "desc"},
+    )
+    return [
+        {"takenAt": sample.takenAt, "counts": counters.unpack_counts(option_ids, sample.votes, sample.likes)}
+        for sample in reversed(samples)
+    ]
+
+
+async def _run_locked(lock_key: str, interval: float, job, label: str):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stats = await locks.run_locked(lock_key, job)
+            if stats and any(value for key, value in stats.items() if key != "seconds"):
+                print(f"{label}: {stats}")
+        except Exception as e:
+            print(f"❌ {label} error: {str(e)}")
+
+
+async def run_archive_periodically(interval: float = ARCHIVE_INTERVAL):
+    """
+    Background task: archives old polls every `interval` seconds, on one
+    worker at a time.
+    """
+    await _run_locked(ARCHIVE_LOCK_KEY, interval, archive_old_polls, "Archived polls")
+
+
+async def run_sampling_periodically(interval: float = SAMPLE_INTERVAL):
+    """
+    Background task: samples changed poll counts every `interval` seconds,
+    on one worker at a time.
+    """
+    await _run_locked(SAMPLE_LOCK_KEY, interval, sample_counts, "Sampled poll counts")
@@ -1,12 +1,78 @@
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from helpers.jwt_auth import verify_token
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+import hashlib
+import os
+import time
+
+load_dotenv()
 
 security = HTTPBearer()
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+TOKEN_CACHE_SIZE = int(os.getenv("API_TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("API_TOKEN_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    id: str
+    email: Optional[str] = None
+    name: Optional[str] = None
+
+
+# verified tokens: sha256(token) -> (expires_at, user), least recently used first
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_token_stats = {"hits": 0, "misses": 0, "expired": 0}
+
+
+def _cached_user(token_hash: bytes) -> Optional[CurrentUser]:
+    entry = _token_cache.get(token_hash)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at <= time.time():
+        # never serve a token past its exp
+        del _token_cache[token_hash]
+        _token_stats["expired"] += 1
+        return None
+    _token_cache.move_to_end(token_hash)
+    return user
+
+
+def _cache_user(token_hash: bytes, user: CurrentUser, payload: Dict[str, Any]):
+    expires_at = time.time() + TOKEN_CACHE_TTL
+    if isinstance(payload.get("exp"), (int, float)):
+        expires_at = min(expires_at, payload["exp"])
+    _token_cache[token_hash] = (expires_at, user)
+    _token_cache.move_to_end(token_hash)
+    while len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+
+
+def token_cache_stats() -> Dict[str, Any]:
+    lookups = _token_stats["hits"] + _token_stats["misses"]
+    return {
+        **_token_stats,
+        "size": len(_token_cache),
+        "max_size": TOKEN_CACHE_SIZE,
+        "hit_rate": _token_stats["hits"] / lookups if lookups else 0.0,
+    }
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> CurrentUser:
     token = credentials.credentials
+    token_hash = hashlib.sha256(token.encode()).digest()
+
+    user = _cached_user(token_hash)
+    if user is not None:
+        _token_stats["hits"] += 1
+        return user
+    _token_stats["misses"] += 1
+
     payload = verify_token(token)
     
     # Extract user information from token
@@ -21,8 +87,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return {
-        "id": user_id,
-        "email": email,
-        "name": name
-    }
+    user = CurrentUser(id=user_id, email=email, name=name)
+    _cache_user(token_hash, user, payload)
+    return user
@@ -0,0 +1,89 @@
+# Coalescing Socket.IO broadcaster for poll updates
+#
+# Instead of one emit per vote, updates are collected per poll option (and per
+# poll for likes) and only the latest count of each is emitted once per window.
+# Counts can arrive out of order (sharded totals, bulk votes, workers
+# publishing concurrently), so the highest count emitted per key is kept
+# across windows and lower or equal counts are dropped: clients never see a
+# count go backwards. High-water marks expire after HIGH_WATER_TTL seconds
+# without updates, which lets a rolled back count through eventually, and
+# the least recently updated ones are evicted beyond HIGH_WATER_SIZE keys.
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WINDOW = int(os.getenv("API_BROADCAST_WINDOW_MS", "100")) / 1000
+HIGH_WATER_TTL = float(os.getenv("API_BROADCAST_HIGH_WATER_TTL", "60"))
+HIGH_WATER_SIZE = int(os.getenv("API_BROADCAST_HIGH_WATER_SIZE", "100000"))
+
+Emit = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def _update_key(data: Dict[str, Any]) -> Tuple[str, str, str]:
+    # (event, poll id, what is counted)
+    if data.get("type") == "like":
+        return "like-update", data["poll_id"], "likes"
+    return "vote-update", data["poll_id"], data["option_id"]
+
+
+def _count(data: Dict[str, Any]) -> int:
+    return data.get("like_count", data.get("vote_count", 0))
+
+
+class CoalescingBroadcaster:
+    def __init__(self, emit: Emit, window: float = WINDOW):
+        self._emit = emit
+        self._window = window
+        self._pending: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        # key -> (highest count seen, when it expires), least recently updated first
+        self._high: "OrderedDict[Tuple[str, str, str], Tuple[int, float]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.emitted = 0
+        self.dropped = 0
+
+    def publish(self, data: Dict[str, Any]):
+        if data.get("type") == "votes":
+            # aggregated update of a bulk vote, one entry per option
+            for option_id, vote_count in data["vote_counts"].items():
+                self.publish({"poll_id": data["poll_id"], "option_id": option_id, "vote_count": vote_count})
+            return
+        self.received += 1
+        key = _update_key(data)
+        count = _count(data)
+        now = time.monotonic()
+        high = self._high.get(key)
+        if high is not None and high[1] > now and count <= high[0]:
+            self.dropped += 1
+            return
+        self._high[key] = (count, now + HIGH_WATER_TTL)
+        self._high.move_to_end(key)
+        while len(self._high) > HIGH_WATER_SIZE:
+            self._high.popitem(last=False)
+        self._pending[key] = data
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def _flush_later(self):
+        # keeps flushing while updates arrive during the emits
+        while self._pending:
+            if self._window > 0:
+                await asyncio.sleep(self._window)
+            await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for (event, _, _), data in pending.items():
+            try:
+                await self._emit(event, data)
+                self.emitted += 1
+            except Exception as e:
+                print(f"❌ Broadcast error: {e}")
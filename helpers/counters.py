@@ -0,0 +1,603 @@
+# Poll counters stored as one Redis hash per poll
+#
+# A vote or like is one script: dedupe, increment, touched mark, version,
+# trending buckets, publish and (stream mode) the write-behind record. The
+# scripts mix per-poll and global keys, so they need the single Redis node
+# the service connects to.
+#
+# A hot poll can be promoted to sharded mode: each user is mapped to one of K
+# shards with its own dedupe set and counts hash, so the increments of a
+# viral poll spread over K keys. A poll's counts are the sum of its base hash
+# and its shard hashes; compensations and reconciliation write to the base
+# hash.
+import asyncio
+import json
+import os
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from helpers.db import redis_client, redis_batch, register_script
+from helpers import trending
+
+load_dotenv()
+
+# shards per promoted poll, 0 or 1 disables promotion
+SHARDS = int(os.getenv("API_COUNTER_SHARDS", "0"))
+# writes per second a single worker must see on a poll to promote it
+PROMOTE_RATE = int(os.getenv("API_COUNTER_PROMOTE_RATE", "500"))
+
+# hash fields are the same keys PollResponse.counts uses: "likes" and option ids
+LIKES_FIELD = "likes"
+
+# internal messages (cache invalidation) go to UPDATES_CHANNEL, vote and like
+# updates to one channel per poll so workers only receive the polls they watch
+UPDATES_CHANNEL = "poll-updates"
+POLL_CHANNEL_PATTERN = f"{UPDATES_CHANNEL}:*"
+
+# poll id -> last time its counters changed, read by the reconciliation job
+TOUCHED_KEY = "polls:touched"
+
+# poll id -> version, bumped whenever the poll's counts or its rows change;
+# the ETags of the read endpoints are derived from it
+VERSIONS_KEY = "polls:versions"
+# bumped when polls are created, pages of get-all-polls may change
+LIST_VERSION_KEY = "polls:list-version"
+
+# poll id -> number of shards of every promoted poll
+SHARDED_KEY = "polls:sharded"
+SHARDED_TYPE = "sharded"
+
+# Dedupe on the voter set, bump the counter, mark the poll as touched, bump
+# its version, add to the trending buckets, append the write-behind record
+# when a stream is given and publish the update in one round trip.
+# Returns the new count, or -1 when the user is already in the set.
+# KEYS: voter set, counts hash, touched zset, versions hash, trending bucket zsets..., [write-behind stream]
+# ARGV: user id, hash field, channel, message json, message field for the count, poll id, now,
+#       bucket count, bucket ttls..., [record field, value...]
+_RECORD_SCRIPT = register_script("""
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+local count = redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+redis.call('ZADD', KEYS[3], ARGV[7], ARGV[6])
+redis.call('HINCRBY', KEYS[4], ARGV[6], 1)
+local buckets = tonumber(ARGV[8])
+for i = 1, buckets do
+    redis.call('ZINCRBY', KEYS[4 + i], 1, ARGV[6])
+    redis.call('EXPIRE', KEYS[4 + i], ARGV[8 + i])
+end
+if KEYS[5 + buckets] then
+    redis.call('XADD', KEYS[5 + buckets], '*', unpack(ARGV, 9 + buckets))
+end
+local message = cjson.decode(ARGV[4])
+message[ARGV[5]] = count
+redis.call('PUBLISH', ARGV[3], cjson.encode(message))
+return count
+""")
+
+# Replaces a poll's counters unless the poll was touched after the cutoff,
+# so a vote landing while the reconciliation job runs is never overwritten.
+# KEYS: counts hash, touched zset
+# ARGV: poll id, cutoff, field, value, field, value...
+_OVERWRITE_SCRIPT = register_script("""
+local touched = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if touched and tonumber(touched) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+if #ARGV > 2 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+end
+return 1
+""")
+
+
+# Same as _RECORD_SCRIPT for one shard, without the update: its total is
+# summed by the caller from all shards, see _PUBLISH_TOTAL_SCRIPT.
+# KEYS: shard member set, shard counts hash, touched zset, versions hash, trending bucket zsets..., [write-behind stream]
+# ARGV: user id, hash field, poll id, now, bucket count, bucket ttls..., [record field, value...]
+_SHARD_RECORD_SCRIPT = register_script("""
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+local count = redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[3])
+redis.call('HINCRBY', KEYS[4], ARGV[3], 1)
+local buckets = tonumber(ARGV[5])
+for i = 1, buckets do
+    redis.call('ZINCRBY', KEYS[4 + i], 1, ARGV[3])
+    redis.call('EXPIRE', KEYS[4 + i], ARGV[5 + i])
+end
+if KEYS[5 + buckets] then
+    redis.call('XADD', KEYS[5 + buckets], '*', unpack(ARGV, 6 + buckets))
+end
+return count
+""")
+
+# Publishes the update of a sharded poll unless a higher total of the same
+# field was already published. The total is summed from shards read one by
+# one after the increment, so a vote racing with another can read a lower
+# total than one already out; it is dropped and the higher one returned.
+# The last total sits in the base hash, which reconciliation replaces.
+# KEYS: base counts hash
+# ARGV: hash field, total, channel, message json, message field for the count
+_PUBLISH_TOTAL_SCRIPT = register_script("""
+local field = 'published:' .. ARGV[1]
+local last = tonumber(redis.call('HGET', KEYS[1], field))
+local total = tonumber(ARGV[2])
+if last and last >= total then
+    return last
+end
+redis.call('HSET', KEYS[1], field, total)
+local message = cjson.decode(ARGV[4])
+message[ARGV[5]] = total
+redis.call('PUBLISH', ARGV[3], cjson.encode(message))
+return total
+""")
+
+# Bulk version of the dedupe and increment for one member set: only users
+# that were not in the set yet bump their field. Returns a 1/0 flag per user.
+# KEYS: member set, counts hash
+# ARGV: user id, hash field, user id, hash field...
+_BULK_RECORD_SCRIPT = register_script("""
+local added = {}
+for i = 1, #ARGV, 2 do
+    if redis.call('SADD', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HINCRBY', KEYS[2], ARGV[i + 1], 1)
+        added[#added + 1] = 1
+    else
+        added[#added + 1] = 0
+    end
+end
+return added
+""")
+
+# poll id -> shard count, for every promoted poll
+_sharded: Dict[str, int] = {}
+# writes seen by this worker in the current second, per unsharded poll
+_rate_second = 0
+_rate_counts: Dict[str, int] = {}
+_promoting: set = set()
+# running promotions, referenced until they finish so they aren't collected
+_promote_tasks: set = set()
+
+
+def counts_key(poll_id: str) -> str:
+    return f"poll:{poll_id}:counts"
+
+
+def updates_channel(poll_id: str) -> str:
+    return f"{UPDATES_CHANNEL}:{poll_id}"
+
+
+def voters_key(poll_id: str) -> str:
+    return f"poll:{poll_id}:voters"
+
+
+def likers_key(poll_id: str) -> str:
+    return f"poll:{poll_id}:likers"
+
+
+def shard_key(poll_id: str, shard: int, kind: str) -> str:
+    # kind is "counts", "voters" or "likers"
+    return f"poll:{{{poll_id}:{shard}}}:{kind}"
+
+
+def shard_for(user_id: str, shards: int) -> int:
+    # a user always lands on the same shard, which keeps dedupe per shard exact
+    return zlib.crc32(user_id.encode()) % shards
+
+
+def shard_count(poll_id: str) -> int:
+    return _sharded.get(poll_id, 0)
+
+
+def _counts_keys(poll_id: str) -> List[str]:
+    return [counts_key(poll_id)] + [shard_key(poll_id, shard, "counts") for shard in range(shard_count(poll_id))]
+
+
+def _to_counts(raws: List[Dict], option_ids: Iterable[str]) -> Dict[str, int]:
+    # sums the base hash and the shard hashes of a poll
+    raw: Dict[str, int] = {}
+    for shard in raws:
+        for field, value in shard.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            raw[field] = raw.get(field, 0) + int(value)
+    counts = {LIKES_FIELD: raw.get(LIKES_FIELD, 0)}
+    for option_id in option_ids:
+        counts[option_id] = raw.get(option_id, 0)
+    return counts
+
+
+def pack_counts(option_ids: Iterable[str], counts: Dict[str, int]) -> Tuple[List[int], int]:
+    # the layout of PollSnapshot and PollCountSample: vote counts aligned
+    # with the poll's option ids sorted, and the like count
+    return [counts.get(option_id, 0) for option_id in sorted(option_ids)], counts.get(LIKES_FIELD, 0)
+
+
+def unpack_counts(option_ids: Iterable[str], votes: List[int], likes: int) -> Dict[str, int]:
+    counts = {LIKES_FIELD: likes}
+    for option_id, count in zip(sorted(option_ids), votes):
+        counts[option_id] = count
+    return counts
+
+
+async def increment_option(poll_id: str, option_id: str, amount: int = 1) -> int:
+    return await redis_client.hincrby(counts_key(poll_id), option_id, amount)
+
+
+async def increment_likes(poll_id: str, amount: int = 1) -> int:
+    return await redis_client.hincrby(counts_key(poll_id), LIKES_FIELD, amount)
+
+
+async def get_counts(poll_id: str, option_ids: Iterable[str]) -> Dict[str, int]:
+    if shard_count(poll_id):
+        return (await get_counts_many([(poll_id, list(option_ids))]))[poll_id]
+    raw = await redis_batch.call("hgetall", counts_key(poll_id))
+    return _to_counts([raw], option_ids)
+
+
+async def get_counts_many(polls: List[Tuple[str, List[str]]]) -> Dict[str, Dict[str, int]]:
+    """
+    Reads the counts of many polls in one pipelined round trip.
+    `polls` is a list of (poll_id, option_ids); options that were never
+    voted on come back as 0.
+    """
+    if not polls:
+        return {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    for poll_id, _ in polls:
+        for key in _counts_keys(poll_id):
+            pipe.hgetall(key)
+    results = iter(await pipe.execute())
+
+    return {
+        poll_id: _to_counts([next(results) for _ in range(1 + shard_count(poll_id))], option_ids)
+        for poll_id, option_ids in polls
+    }
+
+
+async def init_counts(polls: List[Tuple[str, List[str]]]):
+    # zeroes the counters of newly created polls, one pipeline for all of them
+    if not polls:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for poll_id, option_ids in polls:
+        pipe.hset(counts_key(poll_id), mapping={LIKES_FIELD: 0, **{option_id: 0 for option_id in option_ids}})
+    pipe.incr(LIST_VERSION_KEY)
+    await pipe.execute()
+
+
+async def get_versions(poll_ids: List[str]) -> List[int]:
+    # versions of the polls in order, 0 for polls never written to
+    if not poll_ids:
+        return []
+    return [int(version or 0) for version in await redis_batch.call("hmget", VERSIONS_KEY, poll_ids)]
+
+
+async def get_list_version() -> int:
+    return int(await redis_client.get(LIST_VERSION_KEY) or 0)
+
+
+def _bookkeeping_args(poll_id: str, stream: Optional[Tuple[str, Dict[str, str]]]) -> Tuple[List[str], List[Any]]:
+    # keys and args the record scripts take after their own: touched mark,
+    # version, trending buckets and the write-behind stream entry
+    now = time.time()
+    buckets = trending.current_buckets(now)
+    keys = [TOUCHED_KEY, VERSIONS_KEY, *[key for key, _ in buckets]]
+    args = [poll_id, now, len(buckets), *[ttl for _, ttl in buckets]]
+    if stream is not None:
+        key, record = stream
+        keys.append(key)
+        args.extend(item for pair in record.items() for item in pair)
+    return keys, args
+
+
+async def _record(members_key: str, poll_id: str, user_id: str, field: str, message: Dict[str, Any], count_field: str, stream: Optional[Tuple[str, Dict[str, str]]]) -> Optional[int]:
+    _note_write(poll_id)
+    keys, args = _bookkeeping_args(poll_id, stream)
+    count = await _RECORD_SCRIPT(
+        keys=[members_key, counts_key(poll_id), *keys],
+        args=[user_id, field, updates_channel(poll_id), json.dumps(message), count_field, *args],
+    )
+    return None if count == -1 else count
+
+
+async def _record_sharded(kind: str, poll_id: str, user_id: str, field: str, message: Dict[str, Any], count_field: str, stream: Optional[Tuple[str, Dict[str, str]]]) -> Optional[int]:
+    # one pipeline: the shard script (the vote is complete once it ran) and
+    # the field of every shard, read after the increment; then the update
+    # with the total, which never goes below a total already published
+    shards = shard_count(poll_id)
+    shard = shard_for(user_id, shards)
+    keys, args = _bookkeeping_args(poll_id, stream)
+    pipe = redis_client.pipeline(transaction=False)
+    await _SHARD_RECORD_SCRIPT(
+        keys=[shard_key(poll_id, shard, kind), shard_key(poll_id, shard, "counts"), *keys],
+        args=[user_id, field, *args],
+        client=pipe,
+    )
+    for key in _counts_keys(poll_id):
+        pipe.hget(key, field)
+    results = await pipe.execute()
+    if results[0] == -1:
+        return None
+
+    total = sum(int(value or 0) for value in results[1:])
+    try:
+        return int(await _PUBLISH_TOTAL_SCRIPT(
+            keys=[counts_key(poll_id)],
+            args=[field, total, updates_channel(poll_id), json.dumps(message), count_field],
+        ))
+    except Exception as e:
+        # the vote is recorded, only this update is lost
+        print(f"❌ Update of poll {poll_id} not published: {str(e)}")
+        return total
+
+
+async def record_vote(poll_id: str, option_id: str, user_id: str, stream: Optional[Tuple[str, Dict[str, str]]] = None) -> Optional[int]:
+    """
+    Atomically registers the user's vote, increments the option and publishes
+    the vote update. `stream` is a (stream key, record) pair appended in the
+    same script when the vote is new. Returns the new option count, or None
+    if the user had already voted on the poll.
+    """
+    message = {"poll_id": poll_id, "option_id": option_id, "user_id": user_id}
+    if shard_count(poll_id):
+        return await _record_sharded("voters", poll_id, user_id, option_id, message, "vote_count", stream)
+    return await _record(voters_key(poll_id), poll_id, user_id, option_id, message, "vote_count", stream)
+
+
+async def record_like(poll_id: str, user_id: str, stream: Optional[Tuple[str, Dict[str, str]]] = None) -> Optional[int]:
+    """
+    Same as record_vote for likes. Returns the new like count, or None if the
+    user had already liked the poll.
+    """
+    message = {"poll_id": poll_id, "type": "like", "user_id": user_id}
+    if shard_count(poll_id):
+        return await _record_sharded("likers", poll_id, user_id, LIKES_FIELD, message, "like_count", stream)
+    return await _record(likers_key(poll_id), poll_id, user_id, LIKES_FIELD, message, "like_count", stream)
+
+
+async def record_votes(votes: List[Tuple[str, str, str]]) -> List[bool]:
+    """
+    Registers many (poll_id, option_id, user_id) votes: one pipeline runs
+    the dedupe and increments of every member set (the base set, or the
+    user's shard for promoted polls) and reads the new counts, a second one
+    publishes one aggregated update per poll and bumps the trending buckets.
+    Returns whether each vote was new.
+    """
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for index, (poll_id, _, user_id) in enumerate(votes):
+        shards = shard_count(poll_id)
+        if shards:
+            shard = shard_for(user_id, shards)
+            target = (shard_key(poll_id, shard, "voters"), shard_key(poll_id, shard, "counts"))
+        else:
+            target = (voters_key(poll_id), counts_key(poll_id))
+        groups.setdefault(target, []).append(index)
+
+    poll_ids = list(dict.fromkeys(poll_id for poll_id, _, _ in votes))
+    pipe = redis_client.pipeline(transaction=False)
+    for (members_key, hash_key), indices in groups.items():
+        args = [item for index in indices for item in (votes[index][2], votes[index][1])]
+        await _BULK_RECORD_SCRIPT(keys=[members_key, hash_key], args=args, client=pipe)
+    for poll_id in poll_ids:
+        for key in _counts_keys(poll_id):
+            pipe.hgetall(key)
+    results = await pipe.execute()
+
+    added = [False] * len(votes)
+    for indices, flags in zip(groups.values(), results):
+        for index, flag in zip(indices, flags):
+            added[index] = flag == 1
+
+    # poll id -> options that got new votes, and how many
+    changed: Dict[str, Dict[str, int]] = {}
+    for (poll_id, option_id, _), ok in zip(votes, added):
+        if ok:
+            options = changed.setdefault(poll_id, {})
+            options[option_id] = options.get(option_id, 0) + 1
+    if not changed:
+        return added
+
+    raws = iter(results[len(groups):])
+    pipe = redis_client.pipeline(transaction=False)
+    buckets = trending.current_buckets(time.time())
+    for poll_id in poll_ids:
+        raw = [next(raws) for _ in range(1 + shard_count(poll_id))]
+        if poll_id not in changed:
+            continue
+        counts = _to_counts(raw, changed[poll_id])
+        del counts[LIKES_FIELD]
+        pipe.hincrby(VERSIONS_KEY, poll_id, 1)
+        pipe.publish(updates_channel(poll_id), json.dumps({"poll_id": poll_id, "type": "votes", "vote_counts": counts}))
+        for key, ttl in buckets:
+            pipe.zincrby(key, sum(changed[poll_id].values()), poll_id)
+            pipe.expire(key, ttl)
+    try:
+        await pipe.execute()
+    except Exception as e:
+        # the votes are recorded and their rows still have to be written;
+        # the write-behind flush bumps the versions again
+        print(f"❌ Bulk vote updates not published: {str(e)}")
+    return added
+
+
+def _note_write(poll_id: str):
+    # promotes a poll once this worker alone sees PROMOTE_RATE writes in a second
+    global _rate_second
+    if SHARDS <= 1:
+        return
+    second = int(time.monotonic())
+    if second != _rate_second:
+        _rate_second = second
+        _rate_counts.clear()
+    _rate_counts[poll_id] = _rate_counts.get(poll_id, 0) + 1
+    if _rate_counts[poll_id] >= PROMOTE_RATE and poll_id not in _promoting:
+        _promoting.add(poll_id)
+        task = asyncio.create_task(promote(poll_id))
+        _promote_tasks.add(task)
+        task.add_done_callback(_promote_tasks.discard)
+
+
+def mark_sharded(poll_id: str, shards: int):
+    _sharded[poll_id] = shards
+
+
+async def load_sharded():
+    # run at startup, later promotions arrive on UPDATES_CHANNEL
+    for poll_id, shards in (await redis_client.hgetall(SHARDED_KEY)).items():
+        mark_sharded(poll_id.decode() if isinstance(poll_id, bytes) else poll_id, int(shards))
+
+
+async def promote(poll_id: str, shards: int = SHARDS):
+    """
+    Switches a poll to sharded counters on every worker. The users of the
+    dedupe sets are copied to their shard sets; a user voting again while the
+    copy runs is caught by the unique (userId, pollId) index and the
+    write-behind compensation.
+    """
+    try:
+        if not await redis_client.hsetnx(SHARDED_KEY, poll_id, shards):
+            mark_sharded(poll_id, int(await redis_client.hget(SHARDED_KEY, poll_id)))
+            return
+        mark_sharded(poll_id, shards)
+        await redis_client.publish(UPDATES_CHANNEL, json.dumps({"type": SHARDED_TYPE, "poll_id": poll_id, "shards": shards}))
+
+        for kind, members_key in (("voters", voters_key(poll_id)), ("likers", likers_key(poll_id))):
+            async for user_ids in _scan_members(members_key):
+                pipe = redis_client.pipeline(transaction=False)
+                for user_id in user_ids:
+                    pipe.sadd(shard_key(poll_id, shard_for(user_id, shards), kind), user_id)
+                await pipe.execute()
+        print(f"✅ Poll {poll_id} promoted to {shards} counter shards")
+    except Exception as e:
+        print(f"❌ Counter promotion of poll {poll_id} failed: {str(e)}")
+    finally:
+        _promoting.discard(poll_id)
+
+
+async def _scan_members(key: str, count: int = 1000):
+    cursor = 0
+    while True:
+        cursor, members = await redis_client.sscan(key, cursor, count=count)
+        if members:
+            yield [member.decode() if isinstance(member, bytes) else member for member in members]
+        if cursor == 0:
+            break
+
+
+def _members_keys(kind: str, poll_id: str, user_id: str) -> List[str]:
+    keys = [voters_key(poll_id) if kind == "voters" else likers_key(poll_id)]
+    if shard_count(poll_id):
+        keys.append(shard_key(poll_id, shard_for(user_id, shard_count(poll_id)), kind))
+    return keys
+
+
+async def _undo(kind: str, poll_id: str, field: str, user_id: str, keep_member: bool):
+    # the base hash takes the decrement, counts are summed over all hashes;
+    # sharded keys live in other slots so those polls can't use MULTI
+    pipe = redis_client.pipeline(transaction=not shard_count(poll_id))
+    pipe.hincrby(counts_key(poll_id), field, -1)
+    # lets the next update of a sharded poll publish the lower total
+    pipe.hdel(counts_key(poll_id), f"published:{field}")
+    pipe.zadd(TOUCHED_KEY, {poll_id: time.time()})
+    pipe.hincrby(VERSIONS_KEY, poll_id, 1)
+    if not keep_member:
+        for key in _members_keys(kind, poll_id, user_id):
+            pipe.srem(key, user_id)
+    await pipe.execute()
+
+
+async def undo_vote(poll_id: str, option_id: str, user_id: str, keep_member: bool = False):
+    # compensates a record_vote whose database write failed
+    await _undo("voters", poll_id, option_id, user_id, keep_member)
+
+
+async def undo_like(poll_id: str, user_id: str, keep_member: bool = False):
+    await _undo("likers", poll_id, LIKES_FIELD, user_id, keep_member)
+
+
+async def touch(poll_ids: Iterable[str]):
+    # marks polls for the next incremental reconciliation; their rows changed
+    # (userHasVoted/userHasLiked), so their versions are bumped too
+    mapping = {poll_id: time.time() for poll_id in poll_ids}
+    if not mapping:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zadd(TOUCHED_KEY, mapping)
+    for poll_id in mapping:
+        pipe.hincrby(VERSIONS_KEY, poll_id, 1)
+    await pipe.execute()
+
+
+async def bump_versions(poll_ids: List[str]):
+    # the polls' responses changed without their counts, e.g. they were closed
+    if not poll_ids:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for poll_id in poll_ids:
+        pipe.hincrby(VERSIONS_KEY, poll_id, 1)
+    await pipe.execute()
+
+
+async def overwrite_counts_many(polls: List[Tuple[str, Optional[Dict[str, int]]]], cutoff: float) -> List[bool]:
+    """
+    Replaces the counters of many polls in one pipeline. `polls` is a list of
+    (poll_id, counts), counts None deletes the hash. Polls touched after
+    `cutoff` are left alone; returns whether each poll was written.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for poll_id, counts in polls:
+        fields = [item for pair in (counts or {}).items() for item in pair]
+        await _OVERWRITE_SCRIPT(keys=[counts_key(poll_id), TOUCHED_KEY], args=[poll_id, cutoff, *fields], client=pipe)
+    results = await pipe.execute()
+    written = [result == 1 for result in results]
+
+    # the shards of a rewritten poll are dropped, the base hash holds the total
+    rewritten = [poll_id for (poll_id, _), ok in zip(polls, written) if ok]
+    if rewritten:
+        pipe = redis_client.pipeline(transaction=False)
+        for poll_id in rewritten:
+            for key in _counts_keys(poll_id)[1:]:
+                pipe.delete(key)
+            pipe.hincrby(VERSIONS_KEY, poll_id, 1)
+        await pipe.execute()
+    return written
+
+
+async def evict(poll_ids: List[str]):
+    # drops every Redis key of archived polls, their counts live in MongoDB now
+    if not poll_ids:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for poll_id in poll_ids:
+        pipe.delete(counts_key(poll_id), voters_key(poll_id), likers_key(poll_id))
+        for shard in range(shard_count(poll_id)):
+            for kind in ("counts", "voters", "likers"):
+                pipe.delete(shard_key(poll_id, shard, kind))
+        # kept, and bumped: the responses now carry archivedAt
+        pipe.hincrby(VERSIONS_KEY, poll_id, 1)
+    pipe.hdel(SHARDED_KEY, *poll_ids)
+    pipe.zrem(TOUCHED_KEY, *poll_ids)
+    for key in trending.bucket_keys(time.time()):
+        pipe.zrem(key, *poll_ids)
+    await pipe.execute()
+    for poll_id in poll_ids:
+        _sharded.pop(poll_id, None)
+
+
+async def add_members(voters: Dict[str, List[str]], likers: Dict[str, List[str]]):
+    # adds users to the dedupe sets, never removes any
+    by_key: Dict[str, List[str]] = {}
+    for kind, members in (("voters", voters), ("likers", likers)):
+        for poll_id, user_ids in members.items():
+            for user_id in user_ids:
+                for key in _members_keys(kind, poll_id, user_id):
+                    by_key.setdefault(key, []).append(user_id)
+    pipe = redis_client.pipeline(transaction=False)
+    for key, user_ids in by_key.items():
+        pipe.sadd(key, *user_ids)
+    await pipe.execute()
@@ -1,50 +1,219 @@
 # Checking if the database is connected
+import asyncio
+import contextvars
+import random
+import time
 from prisma import Prisma
 import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 import redis.asyncio as redis
+from redis.utils import HIREDIS_AVAILABLE
+from helpers import metrics
 
 # Load environment variables
 load_dotenv()
 
+# Redis connection pool. Connections are opened on first use and reused;
+# when all of them are busy a command waits up to REDIS_POOL_TIMEOUT for one
+# instead of failing, so bursts don't churn connections.
+REDIS_MAX_CONNECTIONS = int(os.getenv("API_REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("API_REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("API_REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("API_REDIS_CONNECT_TIMEOUT", "2"))
+# connections idle for longer are PINGed before they are reused
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("API_REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+# Startup connection attempts per dependency; the wait between attempts starts
+# at STARTUP_BACKOFF seconds and doubles, with jitter, up to STARTUP_BACKOFF_MAX
+STARTUP_ATTEMPTS = int(os.getenv("API_STARTUP_ATTEMPTS", "5"))
+STARTUP_BACKOFF = float(os.getenv("API_STARTUP_BACKOFF", "0.5"))
+STARTUP_BACKOFF_MAX = float(os.getenv("API_STARTUP_BACKOFF_MAX", "5"))
+# readiness checks fail a dependency that takes longer than this
+CHECK_TIMEOUT = float(os.getenv("API_READY_CHECK_TIMEOUT", "1"))
+
 prisma_client = Prisma()
 
-async def check_db_connection():
+async def check_db_connection(timings: Optional[Dict[str, float]] = None):
+    """
+    Connects MongoDB and Redis concurrently, each with retries. Returns True
+    when both are reachable; `timings` gets the seconds each one took.
+    """
     # Check if database URL is configured
     database_url = os.getenv("API_DATABASE_URL")
     if not database_url:
         print("Error: API_DATABASE_URL environment variable is not set")
         return False
-    
+
+    results = await asyncio.gather(
+        _with_retries("Database", connect_prisma, timings),
+        _with_retries("Redis", connect_redis, timings),
+    )
+    return all(results)
+
+async def _with_retries(name: str, connect: Callable[[], Awaitable[None]], timings: Optional[Dict[str, float]]) -> bool:
+    started = time.perf_counter()
+    delay = STARTUP_BACKOFF
+    for attempt in range(1, STARTUP_ATTEMPTS + 1):
+        try:
+            await connect()
+            if timings is not None:
+                timings[name.lower()] = time.perf_counter() - started
+            return True
+        except Exception as e:
+            error_message = str(e)
+            print(f"{name} connection failed (attempt {attempt}/{STARTUP_ATTEMPTS}): {error_message}")
+            if attempt < STARTUP_ATTEMPTS:
+                await asyncio.sleep(delay * random.uniform(0.5, 1))
+                delay = min(delay * 2, STARTUP_BACKOFF_MAX)
+    return False
+
+async def connect_prisma():
     try:
         await prisma_client.connect()
         await prisma_client.poll.find_first()
-        redis_client.ping()
-        print("Database connection successful")
-        return True
-    except Exception as e:
-        error_message = str(e)
-        print(f"Database connection failed: {error_message}")
-        return False
+    except Exception:
+        # the next attempt starts from a fresh query engine
+        if prisma_client.is_connected():
+            await prisma_client.disconnect()
+        raise
+    print("Database connection successful")
 
 async def connect_redis():
+    # the pool connects lazily, this checks Redis is reachable at startup
+    await redis_client.ping()
+    parser = "hiredis" if HIREDIS_AVAILABLE else "Python"
+    print(f"Redis connection successful ({parser} parser, pool of {REDIS_MAX_CONNECTIONS})")
+
+async def _timed_check(check: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
     try:
-        redis_client = redis.Redis(host=os.getenv("API_REDIS_HOST"), port=os.getenv("API_REDIS_PORT"), password=os.getenv("API_REDIS_PASSWORD"))
-        redis_client.ping()
-        print("Redis connection successful")
-        return redis_client
+        await asyncio.wait_for(check(), CHECK_TIMEOUT)
+        return {"ok": True, "latencyMs": round((time.perf_counter() - started) * 1000, 2)}
     except Exception as e:
-        error_message = str(e)
-        print(f"Redis connection failed: {error_message}")
+        return {"ok": False, "latencyMs": round((time.perf_counter() - started) * 1000, 2), "error": str(e) or type(e).__name__}
+
+async def check_dependencies() -> Dict[str, Dict[str, Any]]:
+    # one cheap round trip to each dependency, concurrently, for /readyz
+    mongodb, redis_check = await asyncio.gather(
+        _timed_check(prisma_client.poll.find_first),
+        _timed_check(redis_client.ping),
+    )
+    return {"mongodb": mongodb, "redis": redis_check}
+
+def _redis_pool() -> redis.BlockingConnectionPool:
+    # redis-py picks the hiredis parser by itself when the package is installed
+    return redis.BlockingConnectionPool(
+        host=os.getenv("API_REDIS_HOST", "localhost"),
+        port=int(os.getenv("API_REDIS_PORT", "6379")),
+        password=os.getenv("API_REDIS_PASSWORD"),
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    )
+
+# from_pool: the client owns the pool and closes it in aclose()
+redis_client = redis.Redis.from_pool(_redis_pool())
+
+
+def _pool_size(attr: str) -> int:
+    # read at scrape time, the pool may have been replaced (benchmarks)
+    return len(getattr(redis_client.connection_pool, attr, ()))
+
 
-redis_client = redis.Redis(host=os.getenv("API_REDIS_HOST"), port=os.getenv("API_REDIS_PORT"), password=os.getenv("API_REDIS_PASSWORD"))
+# count and time every query and command, see helpers/metrics.py
+metrics.instrument_prisma(prisma_client)
+metrics.instrument_redis(redis_client)
+metrics.instrument_redis_pool(redis_client.connection_pool)
+metrics.register_gauge("poll_redis_pool_in_use", "Redis connections checked out of the pool", lambda: _pool_size("_in_use_connections"))
+metrics.register_gauge("poll_redis_pool_idle", "Open Redis connections waiting in the pool", lambda: _pool_size("_available_connections"))
+metrics.register_gauge("poll_redis_pool_max", "Redis pool size", lambda: REDIS_MAX_CONNECTIONS)
+
+
+class RedisBatch:
+    """
+    Automatic pipelining: commands sent with `call` during one event loop
+    iteration, by any number of requests, go to Redis as one pipeline. A
+    request gathering several reads pays one round trip and one connection
+    for all of them, and so do concurrent requests. The round trip is added
+    to the stats of every request in the batch.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._pending: List[Tuple[str, tuple, dict, asyncio.Future, Optional[metrics.RequestStats]]] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def call(self, command: str, *args, **kwargs) -> Any:
+        # `command` is the redis-py method name, e.g. "hgetall"
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((command, args, kwargs, future, metrics.current_stats()))
+        if len(self._pending) == 1:
+            # outside any request, the batch is recorded on each of its requests
+            loop.call_soon(self._start, context=contextvars.Context())
+        return await future
+
+    def _start(self):
+        task = asyncio.create_task(self._execute())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self):
+        pending, self._pending = self._pending, []
+        metrics.redis_batch_commands.observe(len(pending))
+        pipe = self._client.pipeline(transaction=False)
+        for command, args, kwargs, _, _ in pending:
+            getattr(pipe, command)(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            results = await pipe.execute(raise_on_error=False)
+        except Exception as e:
+            results = [e] * len(pending)
+        requests = {id(stats): stats for _, _, _, _, stats in pending if stats is not None}
+        metrics.record_shared_redis(list(requests.values()), time.perf_counter() - started)
+        for (_, _, _, future, _), result in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+redis_batch = RedisBatch(redis_client)
+
+
+# Lua scripts of the service, loaded into Redis at startup so the first call
+# of each doesn't pay a NOSCRIPT error and a SCRIPT LOAD
+_scripts: List[Any] = []
+
+
+def register_script(source: str):
+    script = redis_client.register_script(source)
+    _scripts.append(script)
+    return script
+
+
+async def load_scripts() -> int:
+    pipe = redis_client.pipeline(transaction=False)
+    for script in _scripts:
+        pipe.script_load(script.script)
+    await pipe.execute()
+    return len(_scripts)
 
 
 async def disconnect_db():
     try:
+        # flush queued Vote/Like rows while both connections are still open
+        from helpers import write_behind
+        await write_behind.stop()
         await prisma_client.disconnect()
-        redis_client.aclose()
+        await redis_client.aclose()
     except Exception as e:
         error_message = str(e)
         print(f"Database disconnection failed: {error_message}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,102 @@
+# ETags for the poll read endpoints
+#
+# A poll's ETag is derived from its version in helpers.counters (bumped on
+# every vote, like, compensation, reconciliation and write-behind flush) and
+# the requesting user, since responses carry userHasVoted/userHasLiked. A
+# page's ETag combines the versions of its polls. Versions are always read
+# before the response is built, so an ETag can only be older than its body,
+# never newer: a conditional request at worst gets a full response.
+#
+# get-all-polls must know which polls are on a page without MongoDB, so the
+# ids of every page served are kept in Redis, valid only for the list version
+# they were read under: ObjectIds created by other workers in the same second
+# can sort into any page, so no page is safe to reuse once the list changed.
+# The list version is part of every page's ETag for the same reason.
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi.responses import Response
+from helpers.db import redis_client, redis_batch
+from helpers import counters
+
+load_dotenv()
+
+PAGE_TTL = int(os.getenv("API_ETAG_PAGE_TTL", "3600"))
+
+
+def page_key(cursor: Optional[str], limit: int) -> str:
+    return f"polls:page:{cursor or ''}:{limit}"
+
+
+def make(user_id: str, variant: str, versions: List[Tuple[str, int]]) -> str:
+    # weak: equal ETags mean equal content, not equal bytes
+    digest = hashlib.sha1(user_id.encode())
+    digest.update(variant.encode())
+    for poll_id, version in versions:
+        digest.update(f"{poll_id}:{version};".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    # weak comparison, as If-None-Match requires
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == tag for candidate in if_none_match.split(","))
+
+
+def headers(etag: Optional[str]) -> Dict[str, str]:
+    # per user, and clients must revalidate before reusing a response
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=headers(etag))
+
+
+async def poll_etag(poll_id: str, user_id: str, variant: str) -> str:
+    versions = await counters.get_versions([poll_id])
+    return make(user_id, variant, [(poll_id, versions[0])])
+
+
+async def page_ids(cursor: Optional[str], limit: int) -> Tuple[int, Optional[List[str]]]:
+    """
+    The current list version and the ids of the page, None when the page was
+    not served under this version yet.
+    """
+    list_version, raw = await asyncio.gather(
+        redis_batch.call("get", counters.LIST_VERSION_KEY),
+        redis_batch.call("get", page_key(cursor, limit)),
+    )
+    list_version = int(list_version or 0)
+    if raw is None:
+        return list_version, None
+    page = json.loads(raw)
+    if page["listVersion"] != list_version:
+        return list_version, None
+    return list_version, page["ids"]
+
+
+async def remember_page(cursor: Optional[str], limit: int, ids: List[str], list_version: int):
+    # list_version must have been read before the page was fetched
+    page = {"ids": ids, "listVersion": list_version}
+    await redis_client.set(page_key(cursor, limit), json.dumps(page), ex=PAGE_TTL)
+
+
+async def page_etag(cursor: Optional[str], limit: int, user_id: str, variant: str) -> Tuple[Optional[str], int]:
+    """
+    The ETag of a get-all-polls page, None when its ids are not known yet,
+    and the list version to remember the page under.
+    """
+    list_version, ids = await page_ids(cursor, limit)
+    if ids is None:
+        return None, list_version
+    versions = await counters.get_versions(ids)
+    return make(user_id, f"{variant}:{cursor}:{limit}:{list_version}", list(zip(ids, versions))), list_version
@@ -12,9 +12,14 @@ if not JWT_SECRET_KEY:
 
 JWT_ALGORITHM = "HS256"
 
+# built once instead of on every request
+_decoder = jwt.PyJWT()
+_key = JWT_SECRET_KEY.encode()
+_algorithms = [JWT_ALGORITHM]
+
 def verify_token(token: str) -> Dict[str, Any]:
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        payload = _decoder.decode(token, _key, algorithms=_algorithms)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -22,9 +27,9 @@ def verify_token(token: str) -> Dict[str, Any]:
             detail="Token has expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
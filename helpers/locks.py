@@ -0,0 +1,51 @@
+# Redis locks for the periodic jobs
+#
+# Each holder stores a token of its own, and the lock is only extended or
+# released when it still holds that token, so a run that outlived its lock
+# never deletes the lock of the worker that took over. While the job runs the
+# lock is extended every TTL / 3 seconds, so it expires TTL seconds after its
+# holder died, whatever the length of the run.
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+from helpers.db import redis_client, register_script
+
+TTL = 60
+
+_EXTEND_SCRIPT = register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+_RELEASE_SCRIPT = register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+
+async def _keep_alive(key: str, token: str):
+    while True:
+        await asyncio.sleep(TTL / 3)
+        if not await _EXTEND_SCRIPT(keys=[key], args=[token, int(TTL * 1000)]):
+            print(f"❌ Lost lock {key}")
+            return
+
+
+async def run_locked(key: str, job: Callable[[], Awaitable[Any]]) -> Optional[Any]:
+    """
+    Runs job() if no other worker holds the lock `key`, and returns its
+    result. Returns None without running it otherwise.
+    """
+    token = uuid.uuid4().hex
+    if not await redis_client.set(key, token, nx=True, px=int(TTL * 1000)):
+        return None
+    keep_alive = asyncio.create_task(_keep_alive(key, token))
+    try:
+        return await job()
+    finally:
+        keep_alive.cancel()
+        await _RELEASE_SCRIPT(keys=[key], args=[token])
@@ -0,0 +1,325 @@
+# Request instrumentation and Prometheus metrics
+#
+# prisma_client and redis_client are wrapped so every MongoDB query and Redis
+# command (a pipeline counts as one) is counted and timed, both process-wide
+# and for the request being handled. Routes built with TimedRoute record
+# per-route histograms and, with API_DEBUG=true, a Server-Timing header.
+# A round trip or load shared by several requests (automatic Redis batches,
+# single-flight) is added to each of them. Metrics are kept per worker.
+import asyncio
+import inspect
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+
+load_dotenv()
+
+DEBUG = os.getenv("API_DEBUG", "false").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("API_LOOP_LAG_INTERVAL", "0.5"))
+
+PRISMA_MODELS = ("poll", "option", "vote", "like", "pollsnapshot", "pollcountsample")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_seconds", "redis_commands", "redis_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_commands = 0
+        self.redis_seconds = 0.0
+
+    def add(self, other: "RequestStats"):
+        self.db_queries += other.db_queries
+        self.db_seconds += other.db_seconds
+        self.redis_commands += other.redis_commands
+        self.redis_seconds += other.redis_seconds
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;desc="{self.db_queries} queries";dur={self.db_seconds * 1000:.2f}, '
+            f'redis;desc="{self.redis_commands} commands";dur={self.redis_seconds * 1000:.2f}, '
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+# tasks started with gather/create_task copy the context, so they add to the
+# same RequestStats object as the request that started them
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    # the stats of the request being handled, None outside requests
+    return _current.get()
+
+
+def set_current_stats(stats: Optional[RequestStats]):
+    # for tasks doing work on behalf of several requests
+    _current.set(stats)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, value: float = 1, *labels):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (non-cumulative, last is +Inf), sum]
+        self._values: Dict[Tuple[Any, ...], list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", f"{self.name} {self.read()}"]
+
+
+class CounterView(Gauge):
+    # a total kept by another module, read at scrape time
+    type = "counter"
+
+
+ROUTE_LABELS = ("method", "route")
+
+db_queries = Counter("poll_db_queries_total", "MongoDB queries sent by this worker")
+db_seconds = Counter("poll_db_seconds_total", "Time spent waiting on MongoDB")
+redis_commands = Counter("poll_redis_commands_total", "Redis commands and pipelines sent by this worker")
+redis_seconds = Counter("poll_redis_seconds_total", "Time spent waiting on Redis")
+request_duration = Histogram("poll_http_request_duration_seconds", "Request duration per route", ROUTE_LABELS + ("status",))
+request_db_queries = Histogram("poll_http_request_db_queries", "MongoDB queries per request, shared loads counted on each request waiting for them", ROUTE_LABELS, COUNT_BUCKETS)
+request_db_seconds = Histogram("poll_http_request_db_seconds", "Time per request spent on MongoDB", ROUTE_LABELS)
+request_redis_commands = Histogram("poll_http_request_redis_commands", "Redis round trips per request, shared batches counted on each request in them", ROUTE_LABELS, COUNT_BUCKETS)
+request_redis_seconds = Histogram("poll_http_request_redis_seconds", "Time per request spent on Redis", ROUTE_LABELS)
+redis_pool_wait = Histogram("poll_redis_pool_wait_seconds", "Time spent waiting for a free Redis connection")
+redis_pool_errors = Counter("poll_redis_pool_errors_total", "Redis connection checkouts that failed: pool timeout or connect error")
+redis_batch_commands = Histogram("poll_redis_batch_commands", "Commands sent per automatic Redis batch", (), COUNT_BUCKETS)
+singleflight_calls = Counter("poll_singleflight_calls_total", "Loads that went through single-flight", ("kind",))
+singleflight_coalesced = Counter("poll_singleflight_coalesced_total", "Loads that joined an identical load already in flight", ("kind",))
+user_state_batch = Histogram("poll_user_state_batch_requests", "Requests answered by one batched vote/like lookup", (), COUNT_BUCKETS)
+polls_archived = Counter("poll_archived_total", "Polls whose final counts were frozen into a snapshot")
+count_samples = Counter("poll_count_samples_total", "Poll count samples written")
+
+_loop_lag = 0.0
+_metrics: List[Any] = [
+    db_queries, db_seconds, redis_commands, redis_seconds,
+    request_duration, request_db_queries, request_db_seconds, request_redis_commands, request_redis_seconds,
+    redis_pool_wait, redis_pool_errors, redis_batch_commands,
+    singleflight_calls, singleflight_coalesced, user_state_batch, polls_archived, count_samples,
+    Gauge("poll_event_loop_lag_seconds", "How late the last event loop lag probe woke up", lambda: _loop_lag),
+]
+
+
+def register_gauge(name: str, help: str, read: Callable[[], float]):
+    _metrics.append(Gauge(name, help, read))
+
+
+def register_counter(name: str, help: str, read: Callable[[], float]):
+    _metrics.append(CounterView(name, help, read))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _record_db(elapsed: float):
+    db_queries.inc()
+    db_seconds.inc(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+
+
+def _record_redis(elapsed: float):
+    redis_commands.inc()
+    redis_seconds.inc(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.redis_commands += 1
+        stats.redis_seconds += elapsed
+
+
+def record_shared_redis(requests: List[RequestStats], elapsed: float):
+    # a round trip sent for several requests, already counted process-wide
+    for stats in requests:
+        stats.redis_commands += 1
+        stats.redis_seconds += elapsed
+
+
+def _timed(call, record):
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            record(time.perf_counter() - started)
+    return timed
+
+
+class _TimedActions:
+    # stands in for prisma_client.<model>, timing its query methods
+    def __init__(self, actions):
+        self._actions = actions
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._actions, name)
+        if inspect.iscoroutinefunction(attr):
+            return _timed(attr, _record_db)
+        return attr
+
+
+def instrument_prisma(client):
+    for model in PRISMA_MODELS:
+        setattr(client, model, _TimedActions(getattr(client, model)))
+
+    batch_ = client.batch_
+
+    def timed_batch():
+        # a batch is sent as one query when the context exits
+        batch = batch_()
+        batch.commit = _timed(batch.commit, _record_db)
+        return batch
+
+    client.batch_ = timed_batch
+
+
+def instrument_redis(client):
+    client.execute_command = _timed(client.execute_command, _record_redis)
+
+    pipeline = client.pipeline
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        pipe.execute = _timed(pipe.execute, _record_redis)
+        return pipe
+
+    client.pipeline = timed_pipeline
+
+
+def instrument_redis_pool(pool):
+    # times waits for a free connection, the sign that the pool is too small
+    get_connection = pool.get_connection
+
+    async def timed_get_connection(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await get_connection(*args, **kwargs)
+        except Exception:
+            redis_pool_errors.inc()
+            raise
+        finally:
+            redis_pool_wait.observe(time.perf_counter() - started)
+
+    pool.get_connection = timed_get_connection
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL):
+    """
+    Background task: measures how much later than asked a sleep wakes up,
+    i.e. how long callbacks wait for the event loop.
+    """
+    global _loop_lag
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        _loop_lag = max(time.perf_counter() - started - interval, 0.0)
+
+
+class TimedRoute(APIRoute):
+    """
+    Route class recording the request duration and the MongoDB and Redis
+    work of each request, labelled with the route's path template.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        method = next(iter(self.methods), "")
+        path = self.path
+
+        async def timed_handler(request: Request):
+            stats = RequestStats()
+            token = _current.set(stats)
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                if DEBUG:
+                    response.headers["Server-Timing"] = stats.server_timing(time.perf_counter() - started)
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                _current.reset(token)
+                request_duration.observe(time.perf_counter() - started, method, path, status)
+                request_db_queries.observe(stats.db_queries, method, path)
+                request_db_seconds.observe(stats.db_seconds, method, path)
+                request_redis_commands.observe(stats.redis_commands, method, path)
+                request_redis_seconds.observe(stats.redis_seconds, method, path)
+
+        return timed_handler
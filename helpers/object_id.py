@@ -0,0 +1,23 @@
+# Client-side MongoDB ObjectIds, so rows can be referenced before they are written
+import itertools
+import os
+import re
+import threading
+import time
+
+OBJECT_ID_PATTERN = re.compile(r"[0-9a-fA-F]{24}")
+
+# same layout as bson: 4 byte timestamp, 5 byte per-process random, 3 byte counter
+_process_random = os.urandom(5).hex()
+_counter = itertools.count(int.from_bytes(os.urandom(3), "big"))
+_lock = threading.Lock()
+
+
+def new_object_id() -> str:
+    with _lock:
+        counter = next(_counter) & 0xFFFFFF
+    return f"{int(time.time()) & 0xFFFFFFFF:08x}{_process_random}{counter:06x}"
+
+
+def is_object_id(value: str) -> bool:
+    return bool(OBJECT_ID_PATTERN.fullmatch(value))
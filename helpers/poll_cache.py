@@ -0,0 +1,195 @@
+# Read-through cache of poll documents (question + options)
+#
+# Polls don't change after creation, so the document is cached in two tiers:
+# a per-worker LRU with a TTL, then a serialized copy in Redis, then MongoDB.
+# Counts are never cached here, they are always read live from helpers.counters,
+# except the final counts of archived polls (helpers.archive), which no longer
+# change. A poll being archived, marked but without its snapshot yet, is
+# not cached.
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from helpers.db import prisma_client, redis_client, redis_batch
+from helpers.counters import UPDATES_CHANNEL, unpack_counts
+
+load_dotenv()
+
+LOCAL_SIZE = int(os.getenv("API_POLL_CACHE_SIZE", "10000"))
+LOCAL_TTL = float(os.getenv("API_POLL_CACHE_TTL", "300"))
+REDIS_TTL = int(os.getenv("API_POLL_CACHE_REDIS_TTL", "86400"))
+
+INVALIDATE_TYPE = "invalidate"
+
+_local: "OrderedDict[str, tuple]" = OrderedDict()
+_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "evictions": 0}
+
+
+def doc_key(poll_id: str) -> str:
+    return f"poll:{poll_id}:doc"
+
+
+# every poll read goes through these, see helpers.archive for the snapshot
+POLL_INCLUDE = {"options": True, "snapshot": True}
+
+# Prisma doesn't write unset optional fields on MongoDB, and its null filter
+# doesn't match a missing field, so open polls need both branches
+OPEN_POLLS = {"OR": [{"archivedAt": None}, {"archivedAt": {"isSet": False}}]}
+ARCHIVED_POLLS = {"archivedAt": {"isSet": True, "not": None}}
+
+
+def serialize(poll) -> Dict[str, Any]:
+    # plain json-safe dict of a prisma Poll loaded with POLL_INCLUDE
+    doc = {
+        "id": poll.id,
+        "question": poll.question,
+        "userId": poll.userId,
+        "email": poll.email,
+        "createdAt": poll.createdAt.isoformat(),
+        "options": [
+            {"id": option.id, "text": option.text, "pollId": option.pollId}
+            for option in poll.options or []
+        ],
+        "archivedAt": poll.archivedAt.isoformat() if poll.archivedAt else None,
+    }
+    if poll.snapshot:
+        doc["finalCounts"] = unpack_counts([option["id"] for option in doc["options"]], poll.snapshot.votes, poll.snapshot.likes)
+    return doc
+
+
+def cacheable(doc: Dict[str, Any]) -> bool:
+    return not doc.get("archivedAt") or "finalCounts" in doc
+
+
+def _get_local(poll_id: str) -> Optional[Dict[str, Any]]:
+    entry = _local.get(poll_id)
+    if entry is None:
+        return None
+    expires_at, doc = entry
+    if expires_at < time.monotonic():
+        del _local[poll_id]
+        return None
+    _local.move_to_end(poll_id)
+    return doc
+
+
+def put_local(poll_id: str, doc: Dict[str, Any]):
+    _local[poll_id] = (time.monotonic() + LOCAL_TTL, doc)
+    _local.move_to_end(poll_id)
+    while len(_local) > LOCAL_SIZE:
+        _local.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def evict_local(poll_id: str):
+    _local.pop(poll_id, None)
+
+
+async def get_poll(poll_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the serialized poll document or None if the poll doesn't exist.
+    The returned dict is shared, copy it before mutating.
+    """
+    doc = _get_local(poll_id)
+    if doc is not None:
+        _stats["local_hits"] += 1
+        return doc
+
+    raw = await redis_batch.call("get", doc_key(poll_id))
+    if raw is not None:
+        _stats["redis_hits"] += 1
+        doc = json.loads(raw)
+        put_local(poll_id, doc)
+        return doc
+
+    _stats["misses"] += 1
+    poll = await prisma_client.poll.find_unique(
+        where={"id": poll_id},
+        include=POLL_INCLUDE,
+    )
+    if not poll:
+        return None
+
+    doc = serialize(poll)
+    if cacheable(doc):
+        await redis_client.set(doc_key(poll_id), json.dumps(doc), ex=REDIS_TTL)
+        put_local(poll_id, doc)
+    return doc
+
+
+async def get_polls(poll_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Batched get_poll: local hits, then one MGET, then one find_many for the
+    rest. Returns the documents found, keyed by poll id.
+    """
+    docs: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for poll_id in dict.fromkeys(poll_ids):
+        doc = _get_local(poll_id)
+        if doc is not None:
+            _stats["local_hits"] += 1
+            docs[poll_id] = doc
+        else:
+            missing.append(poll_id)
+    if not missing:
+        return docs
+
+    raws = await redis_client.mget([doc_key(poll_id) for poll_id in missing])
+    remaining = []
+    for poll_id, raw in zip(missing, raws):
+        if raw is None:
+            remaining.append(poll_id)
+            continue
+        _stats["redis_hits"] += 1
+        docs[poll_id] = json.loads(raw)
+        put_local(poll_id, docs[poll_id])
+    if not remaining:
+        return docs
+
+    _stats["misses"] += len(remaining)
+    polls = await prisma_client.poll.find_many(
+        where={"id": {"in": remaining}},
+        include=POLL_INCLUDE,
+    )
+    if polls:
+        pipe = redis_client.pipeline(transaction=False)
+        for poll in polls:
+            docs[poll.id] = serialize(poll)
+            if cacheable(docs[poll.id]):
+                put_local(poll.id, docs[poll.id])
+                pipe.set(doc_key(poll.id), json.dumps(docs[poll.id]), ex=REDIS_TTL)
+        if pipe.command_stack:
+            await pipe.execute()
+    return docs
+
+
+async def invalidate(poll_id: str):
+    # drops the Redis copy and tells every worker (through the listener) to drop theirs
+    evict_local(poll_id)
+    await redis_client.delete(doc_key(poll_id))
+    await redis_client.publish(UPDATES_CHANNEL, json.dumps({"type": INVALIDATE_TYPE, "poll_id": poll_id}))
+
+
+async def invalidate_many(poll_ids: List[str]):
+    # invalidate() for many polls in one pipeline
+    if not poll_ids:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for poll_id in poll_ids:
+        evict_local(poll_id)
+        pipe.delete(doc_key(poll_id))
+        pipe.publish(UPDATES_CHANNEL, json.dumps({"type": INVALIDATE_TYPE, "poll_id": poll_id}))
+    await pipe.execute()
+
+
+def stats() -> Dict[str, Any]:
+    lookups = _stats["local_hits"] + _stats["redis_hits"] + _stats["misses"]
+    hits = _stats["local_hits"] + _stats["redis_hits"]
+    return {
+        **_stats,
+        "size": len(_local),
+        "max_size": LOCAL_SIZE,
+        "hit_rate": hits / lookups if lookups else 0.0,
+    }
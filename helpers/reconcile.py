@@ -0,0 +1,173 @@
+# Rebuilds the Redis counters from the Vote and Like rows in MongoDB
+#
+# Polls are processed in batches: one grouped count per model for the batch
+# (a $group aggregation in MongoDB) and one pipeline of guarded overwrites in
+# Redis. A poll whose counters changed within the last SETTLE seconds is
+# skipped, both because its rows may still be in the write-behind queue and
+# so a vote landing during the run is never overwritten; it stays in the
+# touched set and is picked up by the next incremental run.
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from helpers.db import prisma_client, redis_client
+from helpers import counters, locks, poll_cache
+
+load_dotenv()
+
+BATCH_SIZE = int(os.getenv("API_RECONCILE_BATCH_SIZE", "200"))
+SETTLE = float(os.getenv("API_RECONCILE_SETTLE", "60"))
+INTERVAL = float(os.getenv("API_RECONCILE_INTERVAL", "0"))
+
+LAST_RUN_KEY = "reconcile:last_run"
+# copies of the touched set taken by incremental runs
+RUN_KEY_PREFIX = "reconcile:run:"
+RUN_KEY_TTL = 3600
+LOCK_KEY = "reconcile:lock"
+MEMBER_PAGE_SIZE = 5000
+
+
+async def grouped_counts(poll_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    # vote counts per option and like count per poll, from the rows
+    where = {"pollId": {"in": poll_ids}}
+    vote_groups, like_groups = await asyncio.gather(
+        prisma_client.vote.group_by(["pollId", "optionId"], where=where, count=True),
+        prisma_client.like.group_by(["pollId"], where=where, count=True),
+    )
+    grouped: Dict[str, Dict[str, int]] = {}
+    for group in vote_groups:
+        grouped.setdefault(group["pollId"], {})[group["optionId"]] = group["_count"]["_all"]
+    for group in like_groups:
+        grouped.setdefault(group["pollId"], {})[counters.LIKES_FIELD] = group["_count"]["_all"]
+    return grouped
+
+
+async def _rebuild_members(poll_ids: List[str]):
+    # streams the batch's votes and likes by id and adds their users to the dedupe sets
+    where = {"pollId": {"in": poll_ids}}
+    for model, is_vote in ((prisma_client.vote, True), (prisma_client.like, False)):
+        cursor = None
+        while True:
+            query = {"where": where, "take": MEMBER_PAGE_SIZE, "order": {"id": "asc"}}
+            if cursor:
+                query["cursor"] = {"id": cursor}
+                query["skip"] = 1
+            rows = await model.find_many(**query)
+            if not rows:
+                break
+            members: Dict[str, List[str]] = {}
+            for row in rows:
+                members.setdefault(row.pollId, []).append(row.userId)
+            await counters.add_members(members if is_vote else {}, {} if is_vote else members)
+            if len(rows) < MEMBER_PAGE_SIZE:
+                break
+            cursor = rows[-1].id
+
+
+async def _reconcile_batch(poll_ids: List[str], cutoff: float, rebuild_sets: bool, stats: Dict[str, int]):
+    polls = await prisma_client.poll.find_many(
+        where={"id": {"in": poll_ids}},
+        include={"options": True},
+    )
+    grouped = await grouped_counts(poll_ids)
+
+    entries = []
+    found = set()
+    archived = set()
+    for poll in polls:
+        if poll.archivedAt:
+            # closed polls are counted from their rows once, by helpers.archive
+            archived.add(poll.id)
+            continue
+        found.add(poll.id)
+        counts = grouped.get(poll.id, {})
+        entry = {counters.LIKES_FIELD: counts.get(counters.LIKES_FIELD, 0)}
+        for option in poll.options or []:
+            entry[option.id] = counts.get(option.id, 0)
+        entries.append((poll.id, entry))
+    # counters of polls that no longer exist are dropped
+    entries.extend((poll_id, None) for poll_id in poll_ids if poll_id not in found and poll_id not in archived)
+
+    written = await counters.overwrite_counts_many(entries, cutoff)
+    stats["polls"] += len(entries)
+    stats["rewritten"] += sum(written)
+    stats["skipped"] += len(written) - sum(written)
+
+    if rebuild_sets and found:
+        await _rebuild_members(list(found))
+
+
+async def reconcile_all(rebuild_sets: bool = False, batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Walks every poll by id and rewrites its counters from MongoDB.
+    """
+    started = time.time()
+    cutoff = started - SETTLE
+    stats = {"polls": 0, "rewritten": 0, "skipped": 0}
+
+    cursor: Optional[str] = None
+    while True:
+        query = {"where": poll_cache.OPEN_POLLS, "take": batch_size, "order": {"id": "asc"}}
+        if cursor:
+            query["cursor"] = {"id": cursor}
+            query["skip"] = 1
+        polls = await prisma_client.poll.find_many(**query)
+        if not polls:
+            break
+        await _reconcile_batch([poll.id for poll in polls], cutoff, rebuild_sets, stats)
+        if len(polls) < batch_size:
+            break
+        cursor = polls[-1].id
+
+    await redis_client.set(LAST_RUN_KEY, started)
+    return {**stats, "mode": "full", "seconds": round(time.time() - started, 3)}
+
+
+async def reconcile_touched(rebuild_sets: bool = False, batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Rewrites only the polls whose counters changed since the last run and
+    have been quiet for SETTLE seconds.
+    """
+    started = time.time()
+    cutoff = started - SETTLE
+    stats = {"polls": 0, "rewritten": 0, "skipped": 0}
+
+    # the touched set changes under the run (every write-behind flush moves
+    # polls past the cutoff), so the run pages through a copy of it
+    run_key = f"{RUN_KEY_PREFIX}{uuid.uuid4().hex}"
+    try:
+        await redis_client.zrangestore(run_key, counters.TOUCHED_KEY, "-inf", cutoff, byscore=True)
+        await redis_client.expire(run_key, RUN_KEY_TTL)
+        offset = 0
+        while True:
+            poll_ids = await redis_client.zrange(run_key, offset, offset + batch_size - 1)
+            if not poll_ids:
+                break
+            poll_ids = [poll_id.decode() if isinstance(poll_id, bytes) else poll_id for poll_id in poll_ids]
+            await _reconcile_batch(poll_ids, cutoff, rebuild_sets, stats)
+            offset += len(poll_ids)
+    finally:
+        await redis_client.delete(run_key)
+
+    # every poll still at or below the cutoff was in the copy; polls touched
+    # after it keep their newer score and stay queued
+    await redis_client.zremrangebyscore(counters.TOUCHED_KEY, "-inf", cutoff)
+    await redis_client.set(LAST_RUN_KEY, started)
+    return {**stats, "mode": "incremental", "seconds": round(time.time() - started, 3)}
+
+
+async def run_periodically(interval: float = INTERVAL):
+    """
+    Background task: runs the incremental reconciliation every `interval`
+    seconds. A Redis lock makes sure only one worker runs it at a time.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stats = await locks.run_locked(LOCK_KEY, reconcile_touched)
+            if stats and stats["polls"]:
+                print(f"Reconciled counters: {stats}")
+        except Exception as e:
+            print(f"❌ Counter reconciliation error: {str(e)}")
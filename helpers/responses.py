@@ -0,0 +1,62 @@
+# orjson response rendering for the poll routes
+#
+# Controllers build poll responses as plain dicts shaped like the models in
+# models/poll.py (the data comes from our own database and counters, so it is
+# not validated again) and routes return FastJSONResponse directly, which
+# skips FastAPI's jsonable_encoder pass. The models still document the
+# responses in the OpenAPI schema.
+from typing import Any, Dict, List
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+COMPACT = "compact"
+FORMAT_PATTERN = "^(full|compact)$"
+
+
+def _default(obj: Any):
+    # models are serialized field by field, orjson handles the values
+    if isinstance(obj, BaseModel):
+        return dict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def compact_poll(poll: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A poll response with its options and vote counts as arrays aligned by
+    index, for list endpoints.
+    """
+    options = poll["options"]
+    counts = poll["counts"]
+    compact = {
+        "id": poll["id"],
+        "question": poll["question"],
+        "userId": poll["userId"],
+        "email": poll["email"],
+        "createdAt": poll["createdAt"],
+        "optionIds": [option["id"] for option in options],
+        "optionTexts": [option["text"] for option in options],
+        "votes": [counts.get(option["id"], 0) for option in options],
+        "likes": counts.get("likes", 0),
+        "userHasVoted": poll["userHasVoted"],
+        "userHasLiked": poll["userHasLiked"],
+        "archivedAt": poll["archivedAt"],
+    }
+    if "score" in poll:
+        compact["score"] = poll["score"]
+    return compact
+
+
+def compact_polls(polls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [compact_poll(poll) for poll in polls]
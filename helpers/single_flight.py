@@ -0,0 +1,47 @@
+# Single-flight for concurrent identical loads
+#
+# The first caller of a key starts the load in a task, callers arriving while
+# it runs await that task instead of sending the same queries again. Nothing
+# is kept once the load finishes, so this is not a cache: results are never
+# older than the request. Callers share the result and must not modify it.
+# The queries of a load are added to the stats of every caller.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from helpers import metrics
+
+# flight -> the shared load and the MongoDB/Redis work it has done so far
+_inflight: Dict[Tuple[str, Hashable], Tuple[asyncio.Task, metrics.RequestStats]] = {}
+
+
+async def _run(stats: metrics.RequestStats, load: Callable[[], Awaitable[Any]]) -> Any:
+    # the task's own context: counted apart from the request that started it
+    metrics.set_current_stats(stats)
+    return await load()
+
+
+async def do(kind: str, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Runs load() unless a load of the same kind and key is in flight, and
+    returns its result. `kind` labels the metrics.
+    """
+    metrics.singleflight_calls.inc(1, kind)
+    flight = (kind, key)
+    entry = _inflight.get(flight)
+    if entry is None:
+        stats = metrics.RequestStats()
+        entry = _inflight[flight] = (asyncio.create_task(_run(stats, load)), stats)
+        entry[0].add_done_callback(lambda _: _inflight.pop(flight, None))
+    else:
+        metrics.singleflight_coalesced.inc(1, kind)
+    task, stats = entry
+    try:
+        # shielded so a cancelled request doesn't cancel the load of the others
+        return await asyncio.shield(task)
+    finally:
+        current = metrics.current_stats()
+        if current is not None:
+            current.add(stats)
+
+
+def inflight() -> int:
+    return len(_inflight)
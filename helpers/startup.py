@@ -0,0 +1,100 @@
+# Startup phases, readiness and their timings
+#
+# The lifespan only waits for what requests need: MongoDB and Redis, connected
+# concurrently with retries (helpers.db), and the map of sharded polls. The
+# warm-up (Lua scripts, documents of the trending polls) runs in the
+# background; /readyz answers 503 until it is done, while a dependency is
+# unreachable and once shutdown starts. Every phase is timed.
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from helpers.db import check_db_connection, load_scripts
+from helpers import counters, poll_cache, trending
+
+load_dotenv()
+
+# polls per trending window whose documents are loaded at startup, 0 disables
+WARM_POLLS = int(os.getenv("API_WARM_POLLS", "100"))
+
+# phase -> seconds
+timings: Dict[str, float] = {}
+# moved back to the start of main.py's imports by imported()
+_started = time.perf_counter()
+_ready = False
+_stopping = False
+_task: Optional[asyncio.Task] = None
+
+
+def imported(started: float):
+    # `started` is taken before the first import of main.py
+    global _started
+    _started = started
+    timings["imports"] = time.perf_counter() - started
+
+
+async def _timed(phase: str, step):
+    started = time.perf_counter()
+    result = await step()
+    timings[phase] = time.perf_counter() - started
+    return result
+
+
+async def start() -> bool:
+    """
+    The blocking part of startup. Returns False when a dependency stayed
+    unreachable through every retry.
+    """
+    started = time.perf_counter()
+    if not await check_db_connection(timings):
+        return False
+    await _timed("sharded", counters.load_sharded)
+    timings["lifespan"] = time.perf_counter() - started
+    return True
+
+
+async def _warm_trending() -> int:
+    ranked = await asyncio.gather(*(trending.top(window, WARM_POLLS) for window in trending.WINDOWS))
+    poll_ids = list(dict.fromkeys(poll_id for window in ranked for poll_id, _ in window))
+    # fills this worker's LRU and the Redis copies
+    return len(await poll_cache.get_polls(poll_ids))
+
+
+async def warm_up():
+    global _ready
+    try:
+        scripts = await _timed("scripts", load_scripts)
+        polls = await _timed("cache", _warm_trending) if WARM_POLLS > 0 else 0
+        print(f"✅ Warm-up done: {scripts} scripts, {polls} poll documents")
+    except Exception as e:
+        # the warm-up only saves round trips, the worker can serve without it
+        print(f"❌ Warm-up error: {str(e)}")
+    timings["ready"] = time.perf_counter() - _started
+    _ready = True
+    print(f"Startup timings (ms): {report()['startupMs']}")
+
+
+def begin_warm_up():
+    global _task
+    _task = asyncio.create_task(warm_up())
+
+
+def stop():
+    # readiness fails from here on; uvicorn runs the lifespan shutdown once it
+    # stopped accepting connections, so this can't drain traffic by itself:
+    # deployments drain with a preStop delay longer than the readiness period
+    global _stopping
+    _stopping = True
+
+
+def is_ready() -> bool:
+    return _ready and not _stopping
+
+
+def report() -> Dict[str, Any]:
+    return {
+        "ready": is_ready(),
+        "uptimeSeconds": round(time.perf_counter() - _started, 3),
+        "startupMs": {phase: round(seconds * 1000, 1) for phase, seconds in timings.items()},
+    }
@@ -0,0 +1,86 @@
+# Trending polls kept in Redis sorted sets
+#
+# Every vote and like adds 1 to the poll's score in the current time bucket
+# of each window (e.g. 5 minute buckets for the last hour). A window's score
+# is the sum of its buckets weighted by age, halving every quarter window, so
+# recent activity counts most. The weighted union is cached for REFRESH
+# seconds; the read path never touches MongoDB for the ranking.
+import os
+import time
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+from helpers.db import register_script
+
+load_dotenv()
+
+REFRESH = float(os.getenv("API_TRENDING_REFRESH", "5"))
+
+# window -> (bucket seconds, buckets)
+WINDOWS: Dict[str, Tuple[int, int]] = {
+    "hour": (300, 12),
+    "day": (3600, 24),
+}
+DEFAULT_WINDOW = "hour"
+
+# Rebuilds the window's union when its cached copy expired, then reads the top.
+# KEYS: merged zset, bucket zsets (newest first)
+# ARGV: cache ttl in ms, limit, weight of each bucket
+_TOP_SCRIPT = register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local args = {'ZUNIONSTORE', KEYS[1], #KEYS - 1}
+    for i = 2, #KEYS do
+        table.insert(args, KEYS[i])
+    end
+    table.insert(args, 'WEIGHTS')
+    for i = 3, #ARGV do
+        table.insert(args, ARGV[i])
+    end
+    if redis.call(unpack(args)) > 0 then
+        redis.call('PEXPIRE', KEYS[1], ARGV[1])
+    end
+end
+return redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1, 'WITHSCORES')
+""")
+
+
+def bucket_key(window: str, bucket: int) -> str:
+    return f"trending:{window}:{bucket}"
+
+
+def merged_key(window: str) -> str:
+    return f"trending:{window}:merged"
+
+
+def current_buckets(now: float) -> List[Tuple[str, int]]:
+    """
+    (key, ttl seconds) of the bucket each window increments at `now`.
+    """
+    return [
+        (bucket_key(window, int(now // size)), size * (count + 1))
+        for window, (size, count) in WINDOWS.items()
+    ]
+
+
+def bucket_keys(now: float) -> List[str]:
+    # every bucket key still alive at `now`, across all windows
+    return [
+        bucket_key(window, int(now // size) - age)
+        for window, (size, count) in WINDOWS.items()
+        for age in range(count + 1)
+    ]
+
+
+async def top(window: str, limit: int) -> List[Tuple[str, float]]:
+    """
+    The `limit` polls with the highest decayed score in the window, as
+    (poll_id, score), in one round trip.
+    """
+    size, count = WINDOWS[window]
+    newest = int(time.time() // size)
+    keys = [merged_key(window)] + [bucket_key(window, newest - age) for age in range(count)]
+    weights = [0.5 ** (age * 4 / count) for age in range(count)]
+    flat = await _TOP_SCRIPT(keys=keys, args=[int(REFRESH * 1000), limit, *weights])
+    return [
+        (poll_id.decode() if isinstance(poll_id, bytes) else poll_id, float(score))
+        for poll_id, score in zip(flat[::2], flat[1::2])
+    ]
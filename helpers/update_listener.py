@@ -0,0 +1,105 @@
+# Per-worker Redis pub/sub listener for poll updates
+#
+# Each worker keeps one pub/sub connection. It is always subscribed to the
+# internal UPDATES_CHANNEL, and to a poll's channel only while a client of this
+# worker watches the poll. While any local client watches the feed it listens
+# to the whole pattern instead. Every worker delivers updates to its own
+# clients only, so each client receives an update exactly once no matter how
+# many workers run.
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional
+from helpers.db import redis_client
+from helpers.counters import UPDATES_CHANNEL, POLL_CHANNEL_PATTERN, updates_channel
+
+Handler = Callable[[Dict[str, Any]], None]
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class UpdateListener:
+    def __init__(self):
+        self._pubsub = None
+        self._watchers: Dict[str, int] = {}
+        self._feed_watchers = 0
+        # flips on the psubscribe/punsubscribe confirmations; while the pattern
+        # is active a watched poll's update arrives twice (message + pmessage)
+        # and only the pmessage is used
+        self._pattern_active = False
+        self._lock = asyncio.Lock()
+        self._on_update: Optional[Handler] = None
+        self._on_internal: Optional[Handler] = None
+
+    async def run(self, on_update: Handler, on_internal: Handler):
+        self._on_update = on_update
+        self._on_internal = on_internal
+        pubsub = redis_client.pubsub()
+        async with self._lock:
+            await pubsub.subscribe(UPDATES_CHANNEL, *[updates_channel(poll_id) for poll_id in self._watchers])
+            if self._feed_watchers:
+                await pubsub.psubscribe(POLL_CHANNEL_PATTERN)
+            self._pubsub = pubsub
+        try:
+            while True:
+                message = await pubsub.get_message(timeout=None)
+                if message:
+                    self._dispatch(message)
+        finally:
+            self._pubsub = None
+            self._pattern_active = False
+            await pubsub.aclose()
+
+    def _dispatch(self, message: Dict[str, Any]):
+        kind = message["type"]
+        if kind == "psubscribe":
+            self._pattern_active = True
+            return
+        if kind == "punsubscribe":
+            self._pattern_active = False
+            return
+        if kind not in ("message", "pmessage"):
+            return
+
+        data = json.loads(message["data"])
+        if _decode(message["channel"]) == UPDATES_CHANNEL:
+            self._on_internal(data)
+        elif (kind == "pmessage") == self._pattern_active:
+            self._on_update(data)
+
+    async def watch(self, poll_id: str):
+        async with self._lock:
+            self._watchers[poll_id] = self._watchers.get(poll_id, 0) + 1
+            if self._watchers[poll_id] == 1 and self._pubsub is not None:
+                await self._pubsub.subscribe(updates_channel(poll_id))
+
+    async def unwatch(self, poll_id: str):
+        async with self._lock:
+            if poll_id not in self._watchers:
+                return
+            self._watchers[poll_id] -= 1
+            if self._watchers[poll_id] == 0:
+                del self._watchers[poll_id]
+                if self._pubsub is not None:
+                    await self._pubsub.unsubscribe(updates_channel(poll_id))
+
+    async def watch_feed(self):
+        async with self._lock:
+            self._feed_watchers += 1
+            if self._feed_watchers == 1 and self._pubsub is not None:
+                await self._pubsub.psubscribe(POLL_CHANNEL_PATTERN)
+
+    async def unwatch_feed(self):
+        async with self._lock:
+            if self._feed_watchers == 0:
+                return
+            self._feed_watchers -= 1
+            if self._feed_watchers == 0 and self._pubsub is not None:
+                await self._pubsub.punsubscribe(POLL_CHANNEL_PATTERN)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"watched_polls": len(self._watchers), "feed_watchers": self._feed_watchers}
+
+
+update_listener = UpdateListener()
@@ -0,0 +1,333 @@
+# Write-behind persistence of Vote and Like rows
+#
+# The vote/like endpoints only touch Redis; the MongoDB rows are queued here
+# and written with create_many in batches bounded by size and time.
+#
+# Two modes:
+# - memory (default): a bounded asyncio queue per worker, producers wait when
+#   it is full. Rows still queued when the process is killed are lost.
+# - stream (API_WRITE_STREAM=true): records are appended to a Redis stream by
+#   the vote/like script itself, together with the count, and read back
+#   through a consumer group, so entries of a dead worker are claimed and
+#   written by another one. An entry delivered API_WRITE_MAX_DELIVERIES times
+#   without being written is moved to a dead letter stream and its count
+#   rolled back.
+#
+# A batch that hits a duplicate row is written again one record at a time to
+# find it; any other database error retries the whole batch later. In memory
+# mode a batch is tried API_WRITE_ATTEMPTS times with exponential backoff
+# before its counts are rolled back.
+import asyncio
+import os
+import socket
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from prisma.errors import UniqueViolationError
+from helpers.db import prisma_client, redis_client
+from helpers import counters
+from helpers.object_id import new_object_id
+
+load_dotenv()
+
+BATCH_SIZE = int(os.getenv("API_WRITE_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("API_WRITE_FLUSH_INTERVAL", "0.2"))
+QUEUE_SIZE = int(os.getenv("API_WRITE_QUEUE_SIZE", "10000"))
+USE_STREAM = os.getenv("API_WRITE_STREAM", "false").lower() == "true"
+
+STREAM_KEY = "poll-writes"
+STREAM_GROUP = "poll-writers"
+STREAM_CONSUMER = f"{socket.gethostname()}-{os.getpid()}"
+# entries pending this long belong to a dead (or stuck) consumer
+CLAIM_IDLE_MS = 60_000
+CLAIM_EVERY = 30.0
+MAX_DELIVERIES = int(os.getenv("API_WRITE_MAX_DELIVERIES", "10"))
+ATTEMPTS = int(os.getenv("API_WRITE_ATTEMPTS", "5"))
+RETRY_DELAY = float(os.getenv("API_WRITE_RETRY_DELAY", "0.5"))
+# records given up on, kept for inspection and replay
+DEAD_LETTER_KEY = "poll-writes:dead"
+DEAD_LETTER_MAXLEN = 100_000
+
+_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+_stopping = asyncio.Event()
+_task: Optional[asyncio.Task] = None
+
+
+# ids are assigned up front so a replayed record can recognise its own row
+def vote_record(poll_id: str, option_id: str, user_id: str) -> Dict[str, str]:
+    return {"kind": "vote", "id": new_object_id(), "userId": user_id, "pollId": poll_id, "optionId": option_id}
+
+
+def like_record(poll_id: str, user_id: str) -> Dict[str, str]:
+    return {"kind": "like", "id": new_object_id(), "userId": user_id, "pollId": poll_id}
+
+
+async def enqueue(record: Dict[str, str]):
+    if USE_STREAM:
+        await redis_client.xadd(STREAM_KEY, record)
+    else:
+        # backpressure: waits while the queue is full
+        await _queue.put(record)
+
+
+def stream_entry(record: Dict[str, str]) -> Optional[Tuple[str, Dict[str, str]]]:
+    # in stream mode the record is handed to counters.record_vote/record_like,
+    # whose script appends it only when the vote or like is new
+    return (STREAM_KEY, record) if USE_STREAM else None
+
+
+async def enqueue_recorded(record: Dict[str, str]):
+    # queues the record of a vote or like just recorded with stream_entry(record)
+    if not USE_STREAM:
+        await enqueue(record)
+
+
+def _model(record: Dict[str, str]):
+    return prisma_client.vote if record["kind"] == "vote" else prisma_client.like
+
+
+def _row(record: Dict[str, str]) -> Dict[str, str]:
+    return {field: value for field, value in record.items() if field != "kind"}
+
+
+async def _undo(record: Dict[str, str], keep_member: bool = False):
+    try:
+        if record["kind"] == "vote":
+            await counters.undo_vote(record["pollId"], record["optionId"], record["userId"], keep_member)
+        else:
+            await counters.undo_like(record["pollId"], record["userId"], keep_member)
+    except Exception as e:
+        print(f"Failed to roll back {record['kind']} {record['id']}: {str(e)}")
+
+
+# why a record was given up on, by record id
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+
+async def _write_one_by_one(records: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+    retry = []
+    rejected: Dict[str, str] = {}
+    for record in records:
+        model = _model(record)
+        try:
+            await model.create(data=_row(record))
+        except UniqueViolationError:
+            # either our own row from an earlier attempt, or the user voted
+            # before the dedupe set existed and the increment must go
+            if not await model.find_unique(where={"id": record["id"]}):
+                await _undo(record, keep_member=True)
+                rejected[record["id"]] = DUPLICATE
+        except Exception as e:
+            print(f"Database error: {str(e)}")
+            retry.append(record)
+    return retry, rejected
+
+
+async def _flush(records: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+    """
+    Writes the records with one create_many per model. If a batch hits a
+    duplicate its records are written one by one to isolate it. Returns the
+    records that should be retried later, and the ids of those whose count
+    was rolled back with the reason.
+    """
+    retry = []
+    rejected: Dict[str, str] = {}
+    for kind in ("vote", "like"):
+        batch = [record for record in records if record["kind"] == kind]
+        if not batch:
+            continue
+        try:
+            await _model(batch[0]).create_many(data=[_row(record) for record in batch])
+        except UniqueViolationError:
+            batch_retry, batch_rejected = await _write_one_by_one(batch)
+            retry.extend(batch_retry)
+            rejected.update(batch_rejected)
+        except Exception as e:
+            print(f"Database error: {str(e)}")
+            retry.extend(batch)
+
+    # the rows just landed, let the reconciliation job compare again
+    await counters.touch({record["pollId"] for record in records})
+    return retry, rejected
+
+
+async def _flush_retrying(records: List[Dict[str, str]]) -> Dict[str, str]:
+    # memory mode: nothing else holds the records, so they are retried here
+    # and their counts rolled back once ATTEMPTS writes have failed
+    rejected: Dict[str, str] = {}
+    for attempt in range(ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        records, attempt_rejected = await _flush(records)
+        rejected.update(attempt_rejected)
+        if not records:
+            return rejected
+    for record in records:
+        print(f"❌ Giving up on {record['kind']} {record['id']} after {ATTEMPTS} attempts")
+        await _undo(record)
+        rejected[record["id"]] = FAILED
+    return rejected
+
+
+async def write(records: List[Dict[str, str]]) -> Dict[str, str]:
+    """
+    Writes the records now instead of queueing them, for callers that
+    respond after the rows landed. In stream mode records to retry go
+    through the stream. Returns the ids of the records that were rolled
+    back: DUPLICATE or FAILED.
+    """
+    if not USE_STREAM:
+        return await _flush_retrying(records)
+    retry, rejected = await _flush(records)
+    for record in retry:
+        await enqueue(record)
+    return rejected
+
+
+async def _flush_logged(records: List[Dict[str, str]]):
+    try:
+        await _flush_retrying(records)
+    except Exception as e:
+        print(f"❌ Write-behind flush error: {str(e)}")
+
+
+async def _run_memory():
+    loop = asyncio.get_running_loop()
+    done = False
+    while not done:
+        record = await _queue.get()
+        if record is None:
+            break
+        batch = [record]
+        deadline = loop.time() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                record = await asyncio.wait_for(_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if record is None:
+                done = True
+                break
+            batch.append(record)
+        await _flush_logged(batch)
+
+    # drain whatever was queued behind the stop marker
+    batch = []
+    while not _queue.empty():
+        record = _queue.get_nowait()
+        if record is not None:
+            batch.append(record)
+    for i in range(0, len(batch), BATCH_SIZE):
+        await _flush_logged(batch[i:i + BATCH_SIZE])
+
+
+def _decode(fields: Dict) -> Dict[str, str]:
+    return {
+        (key.decode() if isinstance(key, bytes) else key): (value.decode() if isinstance(value, bytes) else value)
+        for key, value in fields.items()
+    }
+
+
+async def _process_entries(entries: List):
+    if not entries:
+        return
+    records = {entry_id: _decode(fields) for entry_id, fields in entries}
+    retry, _ = await _flush(list(records.values()))
+    retry_ids = {record["id"] for record in retry}
+    done_ids = [entry_id for entry_id, record in records.items() if record["id"] not in retry_ids]
+    if done_ids:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xack(STREAM_KEY, STREAM_GROUP, *done_ids)
+        pipe.xdel(STREAM_KEY, *done_ids)
+        await pipe.execute()
+
+
+async def _dead_letter(entries: List):
+    if not entries:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for entry_id, fields in entries:
+        record = _decode(fields)
+        print(f"❌ Giving up on {record['kind']} {record['id']} after {MAX_DELIVERIES} deliveries")
+        await _undo(record)
+        pipe.xadd(DEAD_LETTER_KEY, record, maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe.xack(STREAM_KEY, STREAM_GROUP, *entry_ids)
+    pipe.xdel(STREAM_KEY, *entry_ids)
+    await pipe.execute()
+
+
+async def _claim_stale():
+    # picks up entries left pending by dead consumers (and our own failed
+    # retries); those delivered MAX_DELIVERIES times already are dead-lettered
+    start = "-"
+    while True:
+        pending = await redis_client.xpending_range(STREAM_KEY, STREAM_GROUP, start, "+", BATCH_SIZE, idle=CLAIM_IDLE_MS)
+        if not pending:
+            return
+        entry_ids = [entry["message_id"] for entry in pending]
+        exhausted = {entry["message_id"] for entry in pending if entry["times_delivered"] >= MAX_DELIVERIES}
+        # the idle time is checked again, another consumer may have claimed some
+        entries = await redis_client.xclaim(STREAM_KEY, STREAM_GROUP, STREAM_CONSUMER, CLAIM_IDLE_MS, entry_ids)
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        await _dead_letter([entry for entry in entries if entry[0] in exhausted])
+        await _process_entries([entry for entry in entries if entry[0] not in exhausted])
+        if len(pending) < BATCH_SIZE:
+            return
+        last_id = entry_ids[-1]
+        start = "(" + (last_id.decode() if isinstance(last_id, bytes) else last_id)
+
+
+async def _run_stream():
+    try:
+        await redis_client.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+    loop = asyncio.get_running_loop()
+    next_claim = loop.time()
+    while not _stopping.is_set():
+        try:
+            if loop.time() >= next_claim:
+                await _claim_stale()
+                next_claim = loop.time() + CLAIM_EVERY
+            response = await redis_client.xreadgroup(
+                STREAM_GROUP, STREAM_CONSUMER, {STREAM_KEY: ">"},
+                count=BATCH_SIZE, block=int(FLUSH_INTERVAL * 1000),
+            )
+            for _, entries in response or []:
+                await _process_entries(entries)
+        except Exception as e:
+            print(f"❌ Write-behind stream error: {str(e)}")
+            await asyncio.sleep(FLUSH_INTERVAL)
+
+
+def start():
+    global _task
+    if _task is None:
+        _stopping.clear()
+        _task = asyncio.create_task(_run_stream() if USE_STREAM else _run_memory())
+        print(f"✅ Write-behind started ({'stream' if USE_STREAM else 'memory'} mode)")
+
+
+async def stop():
+    """
+    Flushes everything queued in this worker and stops the writer. In stream
+    mode unread entries stay in the stream for the next worker.
+    """
+    global _task
+    if _task is None:
+        return
+    _stopping.set()
+    if not USE_STREAM:
+        await _queue.put(None)
+    await _task
+    _task = None
+
+
+def stats() -> Dict[str, Any]:
+    return {"mode": "stream" if USE_STREAM else "memory", "queued": _queue.qsize(), "maxsize": QUEUE_SIZE}
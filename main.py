@@ -1,59 +1,90 @@
+import time
+_IMPORTS_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import uvicorn
 from contextlib import asynccontextmanager
 import socketio
 import asyncio
+import argparse
 import json
+import os
 
 from router.poll import router as poll_router
-from helpers.db import check_db_connection, disconnect_db, redis_client 
+from router.sockets import sio, emit_update
+from helpers.db import check_dependencies, disconnect_db, redis_client
+from helpers.auth_middleware import token_cache_stats
+from helpers import archive, counters, metrics, poll_cache, reconcile, single_flight, startup, write_behind
+from helpers.broadcaster import CoalescingBroadcaster
+from helpers.update_listener import update_listener
 
 load_dotenv()
+startup.imported(_IMPORTS_STARTED)
 
-sio = socketio.AsyncServer(
-    async_mode="asgi",
-    cors_allowed_origins=[]
-)
+broadcaster = CoalescingBroadcaster(emit_update)
+
+metrics.register_gauge("poll_socketio_emit_queue_depth", "Updates waiting in the broadcaster to be emitted", broadcaster.pending)
+metrics.register_gauge("poll_write_behind_queue_depth", "Vote/Like rows waiting to be written to MongoDB", lambda: write_behind.stats()["queued"])
+metrics.register_gauge("poll_singleflight_inflight", "Loads currently shared through single-flight", single_flight.inflight)
+metrics.register_gauge("poll_ready", "1 once the worker passes its readiness check", lambda: int(startup.is_ready()))
+metrics.register_gauge("poll_startup_seconds", "Seconds from process start to ready", lambda: startup.timings.get("ready", 0))
+metrics.register_counter("poll_cache_local_hits_total", "Poll documents served from the worker LRU", lambda: poll_cache.stats()["local_hits"])
+metrics.register_counter("poll_cache_redis_hits_total", "Poll documents served from the Redis copy", lambda: poll_cache.stats()["redis_hits"])
+metrics.register_counter("poll_cache_misses_total", "Poll documents loaded from MongoDB", lambda: poll_cache.stats()["misses"])
+metrics.register_counter("poll_cache_evictions_total", "Poll documents evicted from the worker LRU", lambda: poll_cache.stats()["evictions"])
+metrics.register_gauge("poll_cache_local_size", "Poll documents in the worker LRU", lambda: poll_cache.stats()["size"])
+metrics.register_gauge("poll_listener_watched_polls", "Polls whose update channel this worker is subscribed to", lambda: update_listener.stats()["watched_polls"])
+metrics.register_gauge("poll_listener_feed_watchers", "Clients of this worker watching the feed of all polls", lambda: update_listener.stats()["feed_watchers"])
+metrics.register_counter("poll_token_cache_hits_total", "Bearer tokens found in the verified token cache", lambda: token_cache_stats()["hits"])
+metrics.register_counter("poll_token_cache_misses_total", "Bearer tokens verified because they were not cached", lambda: token_cache_stats()["misses"])
+metrics.register_counter("poll_token_cache_expired_total", "Cached tokens dropped because they expired", lambda: token_cache_stats()["expired"])
+metrics.register_gauge("poll_token_cache_size", "Verified tokens cached by this worker", lambda: token_cache_stats()["size"])
+
+def handle_internal_message(data):
+    # internal messages are not forwarded to clients
+    if data.get("type") == poll_cache.INVALIDATE_TYPE:
+        poll_cache.evict_local(data["poll_id"])
+    elif data.get("type") == counters.SHARDED_TYPE:
+        counters.mark_sharded(data["poll_id"], data["shards"])
 
 async def redis_listener_task(sio: socketio.AsyncServer):
     """
-    Listens to 'poll-updates' in Redis and emits the
-    correct event to all connected Socket.IO clients.
+    Listens to the poll channels this worker's clients watch and
+    hands vote and like updates to the broadcaster, which emits
+    the latest counts to the poll's room and the feed room once
+    per window.
     """
-    pubsub = redis_client.pubsub()
-    await pubsub.subscribe("poll-updates")
     print("✅ Starting global Redis listener task...")
     try:
-        while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
-            if message:
-                data = json.loads(message["data"])
-                
-                # Smart router
-                if data.get("type") == "like":
-                    print(f"Broadcasting 'like-update': {data}")
-                    await sio.emit('like-update', data)
-                else:
-                    print(f"Broadcasting 'vote-update': {data}")
-                    await sio.emit('vote-update', data)
-                    
+        await update_listener.run(broadcaster.publish, handle_internal_message)
     except Exception as e:
         print(f"❌ Redis listener task error: {e}")
     finally:
         print("Stopping Redis listener task...")
-        pubsub.unsubscribe()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    db = await check_db_connection()
+    # MongoDB and Redis concurrently, with retries; the warm-up runs after
+    db = await startup.start()
     if not db:
         raise HTTPException(status_code=500, detail="Database connection failed")
-    
+
     asyncio.create_task(redis_listener_task(sio))
+    write_behind.start()
+    asyncio.create_task(metrics.monitor_event_loop())
+    if reconcile.INTERVAL > 0:
+        asyncio.create_task(reconcile.run_periodically())
+    if archive.ARCHIVE_AFTER_DAYS > 0:
+        asyncio.create_task(archive.run_archive_periodically())
+    if archive.SAMPLE_INTERVAL > 0:
+        asyncio.create_task(archive.run_sampling_periodically())
+    startup.begin_warm_up()
     print("Lifespan startup complete.")
     yield
+    startup.stop()
     await disconnect_db()
     print("Lifespan shutdown complete.")
 
@@ -83,11 +114,46 @@ async def read_root():
     return {"message": "API service is running"}
 
 
+@app.get("/healthz")
+async def healthz():
+    # liveness: the worker and its event loop respond; dependencies are /readyz's
+    return {"status": "ok", **startup.report()}
+
+
+@app.get("/readyz")
+async def readyz():
+    # readiness: warm-up done, not shutting down and both dependencies answering
+    dependencies = await check_dependencies()
+    ready = startup.is_ready() and all(check["ok"] for check in dependencies.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "not ready", "dependencies": dependencies, **startup.report()},
+        status_code=200 if ready else 503,
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    # Prometheus text format, per worker
+    return metrics.render()
+
+
 app.include_router(poll_router)
 
 app.mount("/ws/updates", sio_app)
 
 
 
-if __name__ == "__main__":  
-    uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the poll service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")))
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # workers share the port; they read API_WORKERS to switch Socket.IO
+        # to the Redis manager and websocket-only transport
+        os.environ["API_WORKERS"] = str(args.workers)
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
\ No newline at end of file
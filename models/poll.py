@@ -36,6 +36,11 @@ class PollCreate(BaseModel):
     options: List[OptionCreate]
     email: str
 
+class BulkVote(BaseModel):
+    userId: str
+    pollId: str
+    optionId: str
+
 
 class PollResponse(BaseModel):
     id: str
@@ -48,6 +53,40 @@ class PollResponse(BaseModel):
     counts: Dict[str, int]
     userHasVoted: Optional[str]
     userHasLiked: bool
+    # set once the poll is closed, counts are final from then on
+    archivedAt: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PollPage(BaseModel):
+    polls: List[PollResponse]
+    nextCursor: Optional[str] = None
+
+class PollsByIds(BaseModel):
+    polls: List[PollResponse]
+    missing: List[str]
+
+class TrendingPoll(PollResponse):
+    score: float
+
+class TrendingPolls(BaseModel):
+    window: str
+    polls: List[TrendingPoll]
+
+class PollCountSample(BaseModel):
+    takenAt: datetime
+    counts: Dict[str, int]
+
+class PollHistory(BaseModel):
+    pollId: str
+    archivedAt: Optional[datetime] = None
+    samples: List[PollCountSample]
+
+class BulkVoteResult(BaseModel):
+    status: str
+    id: Optional[str] = None
+
+class BulkVoteResponse(BaseModel):
+    recorded: int
+    results: List[BulkVoteResult]
@@ -1,65 +1,164 @@
-from fastapi import APIRouter, Depends, HTTPException
-from controllers.poll import create_poll, get_poll_by_id, get_poll_by_user_id, get_all_polls, vote_on_poll, like_poll
-from models.poll import PollCreate, PollResponse
-from helpers.auth_middleware import get_current_user
-from typing import Dict, Any
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from controllers.poll import create_poll, create_polls, get_poll_by_id, get_polls_by_ids, get_poll_by_user_id, get_all_polls, stream_all_polls, get_trending_polls, get_poll_history, vote_on_poll, bulk_vote, like_poll, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, DEFAULT_TRENDING_SIZE, MAX_TRENDING_SIZE, DEFAULT_HISTORY_SIZE, MAX_HISTORY_SIZE
+from models.poll import PollCreate, PollResponse, PollPage, PollsByIds, PollHistory, TrendingPolls, BulkVote, BulkVoteResponse
+from helpers.auth_middleware import get_current_user, CurrentUser
+from helpers import etags
+from helpers.metrics import TimedRoute
+from helpers.responses import FastJSONResponse, COMPACT, FORMAT_PATTERN, compact_polls
+from typing import Dict, Any, List, Optional
 
-router = APIRouter()
+# routes return FastJSONResponse themselves, skipping FastAPI's encoder pass
+router = APIRouter(route_class=TimedRoute, default_response_class=FastJSONResponse)
 
 url_prefix = "/api/poll"
 
 @router.post(f"{url_prefix}/create-poll")
-async def create_poll_route(poll: PollCreate, current_user: Dict[str, Any] = Depends(get_current_user)):
+async def create_poll_route(poll: PollCreate, current_user: CurrentUser = Depends(get_current_user)):
     try:
-        return await create_poll(poll, current_user)
+        return FastJSONResponse(await create_poll(poll, current_user))
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.get(f"{url_prefix}/get-poll-by-id/{{poll_id}}") 
-async def get_poll_by_id_route(poll_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
+@router.post(f"{url_prefix}/create-polls")
+async def create_polls_route(polls: List[PollCreate], current_user: CurrentUser = Depends(get_current_user)):
     try:
-        return await get_poll_by_id(poll_id, current_user["id"])
+        return FastJSONResponse(await create_polls(polls, current_user))
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.get(f"{url_prefix}/get-poll-by-user-id/{{user_id}}")
-async def get_poll_by_user_id_route(user_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
+@router.get(f"{url_prefix}/get-poll-by-id/{{poll_id}}", response_model=PollResponse) 
+async def get_poll_by_id_route(poll_id: str, request: Request, current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        # the version is read before the poll, a 304 costs one Redis read
+        etag = await etags.poll_etag(poll_id, current_user.id, "full")
+        if etags.matches(request.headers.get("if-none-match"), etag):
+            return etags.not_modified(etag)
+        return FastJSONResponse(await get_poll_by_id(poll_id, current_user.id), headers=etags.headers(etag))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.post(f"{url_prefix}/get-polls-by-ids", response_model=PollsByIds)
+async def get_polls_by_ids_route(
+    poll_ids: List[str] = Body(...),
+    format: str = Query("full", pattern=FORMAT_PATTERN),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    try:
+        result = await get_polls_by_ids(poll_ids, current_user.id)
+        if format == COMPACT:
+            return FastJSONResponse({"polls": compact_polls(result["polls"]), "missing": result["missing"]})
+        return FastJSONResponse(result)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get(f"{url_prefix}/get-poll-by-user-id/{{user_id}}", response_model=List[PollResponse])
+async def get_poll_by_user_id_route(
+    user_id: str,
+    format: str = Query("full", pattern=FORMAT_PATTERN),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     try:
         # Verify user can only access their own polls
-        if current_user["id"] != user_id:
+        if current_user.id != user_id:
             raise HTTPException(status_code=403, detail="Forbidden: Cannot access other user's polls")
-        return await get_poll_by_user_id(user_id)
+        polls = await get_poll_by_user_id(user_id)
+        return FastJSONResponse(compact_polls(polls) if format == COMPACT else polls)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get(f"{url_prefix}/get-all-polls", response_model=PollPage)
+async def get_all_polls_route(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    format: str = Query("full", pattern=FORMAT_PATTERN),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    try:
+        if stream:
+            # NDJSON, walks every page after the cursor with `limit` polls per page
+            return StreamingResponse(
+                stream_all_polls(current_user.id, cursor, limit, format == COMPACT),
+                media_type="application/x-ndjson",
+            )
+        # no ETag until the page's ids are known, the first read records them
+        etag, list_version = await etags.page_etag(cursor, limit, current_user.id, format)
+        if etags.matches(request.headers.get("if-none-match"), etag):
+            return etags.not_modified(etag)
+        page = await get_all_polls(current_user.id, cursor, limit, list_version if etag is None else None)
+        if format == COMPACT:
+            # counts as arrays aligned with each poll's options
+            return FastJSONResponse({"polls": compact_polls(page["polls"]), "nextCursor": page["nextCursor"]}, headers=etags.headers(etag))
+        return FastJSONResponse(page, headers=etags.headers(etag))
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.get(f"{url_prefix}/get-all-polls")
-async def get_all_polls_route(current_user: Dict[str, Any] = Depends(get_current_user)):
+@router.get(f"{url_prefix}/trending", response_model=TrendingPolls)
+async def get_trending_polls_route(
+    window: str = "hour",
+    limit: int = Query(DEFAULT_TRENDING_SIZE, ge=1, le=MAX_TRENDING_SIZE),
+    format: str = Query("full", pattern=FORMAT_PATTERN),
+    current_user: CurrentUser = Depends(get_current_user),
+):
     try:
-        return await get_all_polls(current_user["id"])
+        trending = await get_trending_polls(current_user.id, window, limit)
+        if format == COMPACT:
+            return FastJSONResponse({"window": trending["window"], "polls": compact_polls(trending["polls"])})
+        return FastJSONResponse(trending)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get(f"{url_prefix}/get-poll-history/{{poll_id}}", response_model=PollHistory)
+async def get_poll_history_route(
+    poll_id: str,
+    limit: int = Query(DEFAULT_HISTORY_SIZE, ge=1, le=MAX_HISTORY_SIZE),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    try:
+        return FastJSONResponse(await get_poll_history(poll_id, limit))
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post(f"{url_prefix}/vote-on-poll/{{poll_id}}/{{option_id}}")
-async def vote_on_poll_route(poll_id: str, option_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
+async def vote_on_poll_route(poll_id: str, option_id: str, current_user: CurrentUser = Depends(get_current_user)):
+    try:
+        return FastJSONResponse(await vote_on_poll(poll_id, option_id, current_user))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.post(f"{url_prefix}/bulk-vote", response_model=BulkVoteResponse)
+async def bulk_vote_route(votes: List[BulkVote], current_user: CurrentUser = Depends(get_current_user)):
     try:
-        return await vote_on_poll(poll_id, option_id, current_user)
+        return FastJSONResponse(await bulk_vote(votes, current_user))
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post(f"{url_prefix}/like-poll/{{poll_id}}")
-async def like_poll_route(poll_id: str, current_user: Dict[str, Any] = Depends(get_current_user)):
+async def like_poll_route(poll_id: str, current_user: CurrentUser = Depends(get_current_user)):
     try:
-        return await like_poll(poll_id, current_user)
+        return FastJSONResponse(await like_poll(poll_id, current_user))
     except HTTPException as e:
         raise e
     except Exception as e:
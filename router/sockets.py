@@ -0,0 +1,147 @@
+import os
+import socketio
+from typing import Any, Dict, List, Set
+from dotenv import load_dotenv
+from helpers import counters, poll_cache
+from helpers.object_id import is_object_id
+from helpers.update_listener import update_listener
+
+load_dotenv()
+
+WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+
+def _client_manager():
+    # with several workers, server-side emits (e.g. to a sid) must reach
+    # whichever worker holds the connection
+    if WORKERS <= 1 and os.getenv("API_SOCKETIO_REDIS_MANAGER", "false").lower() != "true":
+        return None
+    password = os.getenv("API_REDIS_PASSWORD")
+    auth = f":{password}@" if password else ""
+    url = f"redis://{auth}{os.getenv('API_REDIS_HOST', 'localhost')}:{os.getenv('API_REDIS_PORT', '6379')}/0"
+    return socketio.AsyncRedisManager(url, channel="socketio")
+
+
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins=[],
+    client_manager=_client_manager(),
+    # long-polling needs sticky sessions, which a shared port can't give
+    transports=["websocket"] if WORKERS > 1 else ["polling", "websocket"],
+)
+
+# clients watching the all-polls view receive every update
+FEED_ROOM = "feed"
+MAX_SUBSCRIPTIONS = 100
+
+# what each local client watches, so a disconnect can release it
+_subscriptions: Dict[str, Set[str]] = {}
+_feed_sids: Set[str] = set()
+
+
+def poll_room(poll_id: str) -> str:
+    return f"poll:{poll_id}"
+
+
+def _poll_ids(data: Any) -> List[str]:
+    # accepts "id", {"poll_id": "id"} or {"poll_ids": ["id", ...]}
+    if isinstance(data, str):
+        poll_ids = [data]
+    elif isinstance(data, dict):
+        poll_ids = data.get("poll_ids") or [data.get("poll_id")]
+    else:
+        poll_ids = []
+    return [poll_id for poll_id in poll_ids if isinstance(poll_id, str) and is_object_id(poll_id)][:MAX_SUBSCRIPTIONS]
+
+
+async def _snapshots(poll_ids: List[str]) -> List[Dict[str, Any]]:
+    docs = await poll_cache.get_polls(poll_ids)
+    found = [docs[poll_id] for poll_id in poll_ids if poll_id in docs]
+    # archived polls have no counters left, their final counts come with the doc
+    counts = await counters.get_counts_many([
+        (doc["id"], [option["id"] for option in doc["options"]]) for doc in found if "finalCounts" not in doc
+    ])
+    return [{"poll_id": doc["id"], "counts": doc["finalCounts"] if "finalCounts" in doc else counts[doc["id"]]} for doc in found]
+
+
+async def _join(sid: str, poll_id: str):
+    watched = _subscriptions.setdefault(sid, set())
+    if poll_id in watched:
+        return
+    watched.add(poll_id)
+    await sio.enter_room(sid, poll_room(poll_id))
+    await update_listener.watch(poll_id)
+
+
+async def _leave(sid: str, poll_id: str):
+    watched = _subscriptions.get(sid, set())
+    if poll_id not in watched:
+        return
+    watched.discard(poll_id)
+    await sio.leave_room(sid, poll_room(poll_id))
+    await update_listener.unwatch(poll_id)
+
+
+@sio.event
+async def subscribe(sid, data):
+    """
+    Joins the client to the rooms of the given polls and sends it a
+    'poll-snapshot' with the current counts of each one. Rejected when the
+    client would watch more than MAX_SUBSCRIPTIONS polls.
+    """
+    poll_ids = _poll_ids(data)
+    watched = _subscriptions.get(sid, set())
+    if len(watched | set(poll_ids)) > MAX_SUBSCRIPTIONS:
+        return {"subscribed": [], "error": f"A client can watch at most {MAX_SUBSCRIPTIONS} polls"}
+
+    # join before reading counts so no update falls between the two
+    for poll_id in poll_ids:
+        await _join(sid, poll_id)
+
+    snapshots = await _snapshots(poll_ids)
+    found = {snapshot["poll_id"] for snapshot in snapshots}
+    for poll_id in poll_ids:
+        if poll_id not in found:
+            await _leave(sid, poll_id)
+    for snapshot in snapshots:
+        await sio.emit("poll-snapshot", snapshot, to=sid)
+    return {"subscribed": [snapshot["poll_id"] for snapshot in snapshots]}
+
+
+@sio.event
+async def unsubscribe(sid, data):
+    for poll_id in _poll_ids(data):
+        await _leave(sid, poll_id)
+
+
+@sio.on("subscribe-feed")
+async def subscribe_feed(sid, data=None):
+    if sid in _feed_sids:
+        return
+    _feed_sids.add(sid)
+    await sio.enter_room(sid, FEED_ROOM)
+    await update_listener.watch_feed()
+
+
+@sio.on("unsubscribe-feed")
+async def unsubscribe_feed(sid, data=None):
+    if sid not in _feed_sids:
+        return
+    _feed_sids.discard(sid)
+    await sio.leave_room(sid, FEED_ROOM)
+    await update_listener.unwatch_feed()
+
+
+@sio.event
+async def disconnect(sid, *args):
+    for poll_id in _subscriptions.pop(sid, set()):
+        await update_listener.unwatch(poll_id)
+    if sid in _feed_sids:
+        _feed_sids.discard(sid)
+        await update_listener.unwatch_feed()
+
+
+async def emit_update(event: str, data: Dict[str, Any]):
+    # only clients of this worker watching the poll (or the feed) get the update;
+    # every worker receives the update from Redis, so the queue is skipped
+    await sio.emit(event, data, to=[poll_room(data["poll_id"]), FEED_ROOM], ignore_queue=True)
@@ -0,0 +1,42 @@
+"""
+Archives old polls: freezes their final counts into snapshots in MongoDB and
+evicts their Redis keys.
+
+    python -m scripts.archive_polls                    # polls older than API_ARCHIVE_AFTER_DAYS
+    python -m scripts.archive_polls --after-days 90
+    python -m scripts.archive_polls --sample           # also sample the counts of open polls
+
+Polls touched within API_RECONCILE_SETTLE seconds are closed but snapshotted
+by a later run.
+"""
+import argparse
+import asyncio
+
+from helpers.db import prisma_client, redis_client
+from helpers import archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old polls into MongoDB snapshots")
+    parser.add_argument("--after-days", type=float, default=archive.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--sample", action="store_true", help="also write a count sample for every changed open poll")
+    parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+    args = parser.parse_args()
+    if args.after_days <= 0:
+        parser.error("--after-days (or API_ARCHIVE_AFTER_DAYS) must be positive")
+
+    async def run():
+        await prisma_client.connect()
+        try:
+            if args.sample:
+                print(await archive.sample_counts(args.batch_size))
+            print(await archive.archive_old_polls(args.after_days, args.batch_size))
+        finally:
+            await prisma_client.disconnect()
+            await redis_client.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Multi-worker fan-out check.
+
+Starts the service with several workers on one port (against the MongoDB and
+Redis configured in .env), connects many Socket.IO clients, casts votes and
+verifies every client received each vote update exactly once.
+
+    pip install aiohttp
+    python -m scripts.fanout_harness --workers 4 --clients 40 --votes 60
+
+Coalescing is disabled (API_BROADCAST_WINDOW_MS=0) and votes are spaced out
+so every count is emitted on its own; a missing count is then a lost update
+and a repeated one a duplicate.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import aiohttp
+import jwt
+import socketio
+from dotenv import load_dotenv
+
+from helpers.object_id import new_object_id
+
+load_dotenv()
+
+
+def make_token(user_id: str) -> str:
+    payload = {"sub": user_id, "email": f"{user_id}@fanout.test", "name": "fanout", "exp": int(time.time()) + 3600}
+    return jwt.encode(payload, os.getenv("JWT_SECRET_KEY"), algorithm="HS256")
+
+
+async def wait_for_service(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("service did not start")
+
+
+async def connect_client(base_url: str, poll_id: str, feed: bool, received: List[Tuple[str, int]]):
+    client = socketio.AsyncClient()
+
+    @client.on("vote-update")
+    async def on_vote(data):
+        if data["poll_id"] == poll_id:
+            received.append((data["option_id"], data["vote_count"]))
+
+    await client.connect(base_url, socketio_path="/ws/updates", transports=["websocket"])
+    if feed:
+        await client.emit("subscribe-feed")
+    else:
+        await client.call("subscribe", {"poll_id": poll_id})
+    return client
+
+
+async def run(args) -> bool:
+    base_url = f"http://127.0.0.1:{args.port}"
+    await wait_for_service(base_url)
+
+    owner = new_object_id()
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{base_url}/api/poll/create-poll",
+            json={"question": "fan-out check", "email": "", "options": [{"text": f"option {i}"} for i in range(args.options)]},
+            headers={"Authorization": f"Bearer {make_token(owner)}"},
+        ) as response:
+            response.raise_for_status()
+            poll = await response.json()
+        poll_id = poll["id"]
+        option_ids = [option["id"] for option in poll["options"]]
+
+        received: Dict[int, List[Tuple[str, int]]] = {i: [] for i in range(args.clients)}
+        clients = [
+            await connect_client(base_url, poll_id, i % 4 == 0, received[i])
+            for i in range(args.clients)
+        ]
+        await asyncio.sleep(1)
+
+        expected = Counter()
+        for _ in range(args.votes):
+            option_id = random.choice(option_ids)
+            async with session.post(
+                f"{base_url}/api/poll/vote-on-poll/{poll_id}/{option_id}",
+                headers={"Authorization": f"Bearer {make_token(new_object_id())}"},
+            ) as response:
+                response.raise_for_status()
+            expected[option_id] += 1
+            await asyncio.sleep(args.spacing)
+        await asyncio.sleep(2)
+
+    for client in clients:
+        await client.disconnect()
+
+    wanted = Counter({(option_id, n): 1 for option_id, total in expected.items() for n in range(1, total + 1)})
+    ok = True
+    for i, updates in received.items():
+        seen = Counter(updates)
+        missing = wanted - seen
+        duplicates = {update: n for update, n in seen.items() if n > 1}
+        if missing or duplicates:
+            ok = False
+            print(f"client {i}: {sum(missing.values())} missing, {len(duplicates)} duplicated")
+    print(f"{args.clients} clients, {args.votes} votes, {args.workers} workers: {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check Socket.IO fan-out across several workers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--votes", type=int, default=60)
+    parser.add_argument("--options", type=int, default=3)
+    parser.add_argument("--spacing", type=float, default=0.05, help="seconds between votes")
+    args = parser.parse_args()
+
+    env = {**os.environ, "API_BROADCAST_WINDOW_MS": "0"}
+    server = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(args.workers), "--port", str(args.port)],
+        env=env,
+    )
+    try:
+        ok = asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Folds the legacy string counters (`poll:{id}:likes`, `poll:{id}:option:{oid}`)
+into the per-poll hashes used by helpers.counters.
+
+Each key is moved with a small Lua script (GET, HINCRBY, DEL) so the move is
+atomic and safe to run while the new code is already taking writes: values
+are added to the hash, never overwritten. Run it once right after deploying.
+
+    python -m scripts.migrate_counters [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import re
+
+from helpers.db import redis_client
+from helpers.counters import counts_key, LIKES_FIELD
+
+LEGACY_KEY_PATTERN = re.compile(r"^poll:([^:]+):(?:(likes)|option:([^:]+))$")
+
+FOLD_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('HINCRBY', KEYS[2], ARGV[1], value)
+    redis.call('DEL', KEYS[1])
+end
+return value
+"""
+
+
+def parse_legacy_key(key: str):
+    # returns (poll_id, hash field) or None for keys that aren't legacy counters
+    match = LEGACY_KEY_PATTERN.match(key)
+    if not match:
+        return None
+    poll_id, likes, option_id = match.groups()
+    return poll_id, LIKES_FIELD if likes else option_id
+
+
+async def migrate(batch_size: int, dry_run: bool):
+    fold = redis_client.register_script(FOLD_SCRIPT)
+    moved_keys = 0
+    moved_total = 0
+    polls = set()
+
+    batch = []
+
+    async def flush():
+        nonlocal moved_keys, moved_total
+        if not batch:
+            return
+        if dry_run:
+            values = await redis_client.mget([key for key, _, _ in batch])
+        else:
+            pipe = redis_client.pipeline(transaction=False)
+            for key, poll_id, field in batch:
+                await fold(keys=[key, counts_key(poll_id)], args=[field], client=pipe)
+            values = await pipe.execute()
+        for (_, poll_id, _), value in zip(batch, values):
+            if value is not None:
+                moved_keys += 1
+                moved_total += int(value)
+                polls.add(poll_id)
+        batch.clear()
+
+    for pattern in ("poll:*:likes", "poll:*:option:*"):
+        async for raw_key in redis_client.scan_iter(match=pattern, count=batch_size):
+            key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+            parsed = parse_legacy_key(key)
+            if parsed is None:
+                continue
+            batch.append((key, *parsed))
+            if len(batch) >= batch_size:
+                await flush()
+    await flush()
+
+    action = "Would move" if dry_run else "Moved"
+    print(f"{action} {moved_keys} keys ({moved_total} counts) into {len(polls)} poll hashes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold legacy poll counter keys into per-poll hashes")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be moved")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            await migrate(args.batch_size, args.dry_run)
+        finally:
+            await redis_client.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Rebuilds the Redis vote and like counters from MongoDB.
+
+    python -m scripts.reconcile_counters                 # polls touched since the last run
+    python -m scripts.reconcile_counters --full          # every poll, e.g. after a Redis flush
+    python -m scripts.reconcile_counters --full --rebuild-sets
+
+--rebuild-sets also re-adds every voter and liker to the per-poll dedupe sets,
+which a Redis flush loses as well.
+"""
+import argparse
+import asyncio
+
+from helpers.db import prisma_client, redis_client
+from helpers import reconcile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild Redis poll counters from MongoDB")
+    parser.add_argument("--full", action="store_true", help="reconcile every poll instead of the touched ones")
+    parser.add_argument("--rebuild-sets", action="store_true", help="also rebuild the voter and liker sets")
+    parser.add_argument("--batch-size", type=int, default=reconcile.BATCH_SIZE)
+    args = parser.parse_args()
+
+    async def run():
+        await prisma_client.connect()
+        try:
+            if args.full:
+                stats = await reconcile.reconcile_all(args.rebuild_sets, args.batch_size)
+            else:
+                stats = await reconcile.reconcile_touched(args.rebuild_sets, args.batch_size)
+            print(stats)
+        finally:
+            await prisma_client.disconnect()
+            await redis_client.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()